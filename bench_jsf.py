@@ -0,0 +1,552 @@
+"""
+Benchmarks for the jsf module.
+
+Run as `python bench_jsf.py [name ...]`.
+Without names, all benchmarks are run.
+"""
+
+from pathlib import Path
+from statistics import median
+import subprocess
+import sys
+from time import perf_counter
+from typing import Callable, Dict, Iterator, List
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {}
+
+
+def benchmark(f: Callable[[], None]) -> Callable[[], None]:
+    BENCHMARKS[f.__name__[len('bench_'):]] = f
+    return f
+
+
+def report(name: str, seconds: float, baseline: float = 0.0) -> None:
+    print('{:<40} {:>10.3f} ms'.format(name, (seconds - baseline) * 1e3))
+
+
+def _run_python(code: str, repeat: int) -> float:
+    times: List[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True,
+                       cwd=str(Path(__file__).parent))
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+@benchmark
+def bench_import(repeat: int = 20) -> None:
+    """
+    Cold start: wall time of fresh interpreters, less the bare startup.
+    """
+    baseline = _run_python('pass', repeat)
+    report('import jsf', _run_python('import jsf', repeat), baseline)
+    report('import jsf, first JWCrypto use',
+           _run_python('import jsf; jsf.JWK', repeat), baseline)
+
+
+@benchmark
+def bench_remote_signing(count: int = 200, latency: float = 0.005) -> None:
+    """
+    Signing through a backend with a simulated round trip time
+    and four calls in flight at most.
+    """
+    import asyncio
+    from jsf import JSF, JWK
+    from jsf.signers import BatchingSigner, LocalSigner, add_single_signature
+
+    key = JWK.generate(kty='EC', crv='P-256')
+
+    async def sign_all(signer) -> None:
+        await asyncio.gather(*(
+            add_single_signature(JSF({'id': i}), 'signature', signer, 'ES256')
+            for i in range(count)))
+        await signer.close()
+
+    for name, signer in [
+            ('one call per signature',
+             BatchingSigner(LocalSigner(key, latency), max_batch=1)),
+            ('batched', BatchingSigner(LocalSigner(key, latency)))]:
+        start = perf_counter()
+        asyncio.run(sign_all(signer))
+        report('{} signatures, {}'.format(count, name), perf_counter() - start)
+
+
+def _time(f: Callable[[], object], repeat: int) -> float:
+    times: List[float] = []
+    for _ in range(repeat):
+        start = perf_counter()
+        f()
+        times.append(perf_counter() - start)
+    return median(times)
+
+
+@benchmark
+def bench_canonicalize(repeat: int = 10) -> None:
+    """
+    The explicit-stack canonicalizer against the recursive one.
+    """
+    from jsf.canonical import Canonicalizer
+    from org.webpki.json.Canonicalize import canonicalize
+
+    wide = {'k{}'.format(i): {'name': 'x' * 10, 'id': i, 'ok': True,
+                              'values': [1.5, 2, 's']}
+            for i in range(2000)}
+    deep: List[object] = []
+    inner = deep
+    for _ in range(300):
+        inner.append({'a': []})
+        inner = inner[0]['a']
+
+    canonicalizer = Canonicalizer()
+    for name, obj in [('wide', wide), ('deep', deep)]:
+        report('{}, recursive'.format(name),
+               _time(lambda: canonicalize(obj), repeat))
+        report('{}, explicit stack'.format(name),
+               _time(lambda: canonicalizer.dumps(obj), repeat))
+
+
+@benchmark
+def bench_records(repeat: int = 10) -> None:
+    """
+    Canonicalizing dataclass records directly and through `asdict`.
+    """
+    from dataclasses import asdict, dataclass
+    from jsf.canonical import Canonicalizer
+
+    @dataclass
+    class Line:
+        sku: str
+        quantity: int
+        price: float
+
+    @dataclass
+    class Order:
+        id: int
+        customer: str
+        lines: List[Line]
+
+    orders = [Order(i, 'customer', [Line('sku', j, 9.99) for j in range(20)])
+              for i in range(200)]
+    canonicalizer = Canonicalizer()
+    report('200 orders, asdict',
+           _time(lambda: canonicalizer.dumps([asdict(o) for o in orders]),
+                 repeat))
+    report('200 orders, direct',
+           _time(lambda: canonicalizer.dumps(orders), repeat))
+
+
+@benchmark
+def bench_shapes(repeat: int = 10) -> None:
+    """
+    A stream of events with the same members, with and without
+    the shape cache.
+    """
+    from jsf.canonical import Canonicalizer
+
+    events = [{'eventId': i, 'timestamp': '2019-02-10T11:23:06Z',
+               'source': 'sensor', 'kind': 'reading', 'value': i * 0.5,
+               'unit': 'C', 'tags': {'site': 'a', 'rack': 'b'}}
+              for i in range(5000)]
+    for name, canonicalizer in [
+            ('uncached', Canonicalizer(shape_cache_size=0)),
+            ('cached', Canonicalizer())]:
+        report('5000 events, {}'.format(name),
+               _time(lambda: [canonicalizer.dumps(e) for e in events],
+                     repeat))
+
+
+@benchmark
+def bench_resign(repeat: int = 10) -> None:
+    """
+    Re-signing a large document after editing one leaf,
+    with and without tracking.
+    """
+    from jsf import JSF, JWK
+    from jsf.canonical import track
+
+    key = JWK.generate(kty='EC', crv='P-256')
+
+    def make_state() -> dict:
+        return {'nodes': [{'id': i, 'tags': ['a', 'b', 'c'],
+                           'data': {'x': i * 0.5, 'y': [i] * 10}}
+                          for i in range(5000)]}
+
+    for name, state in [('plain', make_state()),
+                        ('tracked', track(make_state()))]:
+        jsf = JSF(state)
+        jsf.add_single_signature('signature', key, 'ES256')
+
+        def resign() -> None:
+            state['nodes'][1234]['data']['x'] += 1
+            jsf.add_single_signature('signature', key, 'ES256')
+
+        report('5000 nodes, one edit, {}'.format(name), _time(resign, repeat))
+
+
+@benchmark
+def bench_hostile(repeat: int = 10) -> None:
+    """
+    Verifying a large payload carrying a malformed signature,
+    against a well-formed one.
+    """
+    from jsf import JSF, JWK, InvalidJWSSignature
+
+    key = JWK.generate(kty='EC', crv='P-256')
+    jsf = JSF({'nodes': [{'id': i, 'name': 'x' * 20} for i in range(20000)]})
+    jsf.add_single_signature('signature', key, 'ES256')
+    valid = jsf.payload
+    hostile = dict(valid, signature=dict(valid['signature'],
+                                         value='A' * 1000))
+
+    def verify(payload) -> None:
+        try:
+            JSF(payload).verify('signature', key=key)
+        except InvalidJWSSignature:
+            pass
+
+    report('20000 nodes, valid', _time(lambda: verify(valid), repeat))
+    report('20000 nodes, malformed signature',
+           _time(lambda: verify(hostile), repeat))
+
+
+@benchmark
+def bench_service(count: int = 400) -> None:
+    """
+    Concurrent verification requests to the HTTP service,
+    one per batch and coalesced.
+    """
+    import asyncio
+    import json
+    from jsf import JSF, JWK
+    from jsf.server import VerificationService, start_server
+
+    key = JWK.generate(kty='EC', crv='P-256')
+    header = {'publicKey': key.export_public(True)}
+    bodies = []
+    for i in range(count):
+        jsf = JSF({'id': i})
+        jsf.add_single_signature('signature', key, 'ES256', header)
+        bodies.append(json.dumps({'document': jsf.payload}).encode('utf-8'))
+
+    async def post(port: int, body: bytes) -> None:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write('POST /verify HTTP/1.1\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(len(body))
+                     .encode('latin-1') + body)
+        await reader.read()
+        writer.close()
+
+    async def run(service: VerificationService) -> None:
+        server = await start_server(service, host='127.0.0.1', port=0)
+        port = server.sockets[0].getsockname()[1]
+        await asyncio.gather(*(post(port, b) for b in bodies))
+        server.close()
+        await server.wait_closed()
+        await service.close()
+
+    for name, service in [
+            ('one request per batch', VerificationService(max_batch=1)),
+            ('coalesced', VerificationService())]:
+        start = perf_counter()
+        asyncio.run(run(service))
+        report('{} requests, {}'.format(count, name), perf_counter() - start)
+
+
+@benchmark
+def bench_batch(count: int = 2000, repeat: int = 3) -> None:
+    """
+    Verifying a column of documents with embedded keys,
+    one `JSF` at a time and with `verify_batch`.
+    """
+    from jsf import JSF, JWK, InvalidJWSSignature
+    from jsf.batch import verify_batch
+
+    key = JWK.generate(kty='EC', crv='P-256')
+    header = {'publicKey': key.export_public(True)}
+    column = []
+    for i in range(count):
+        jsf = JSF({'id': i, 'name': 'row'})
+        jsf.add_single_signature('signature', key, 'ES256', header)
+        column.append(jsf.payload if i % 4 else dict(jsf.payload, id=-1))
+
+    def one_at_a_time() -> None:
+        mask = []
+        for document in column:
+            try:
+                JSF(document).verify('signature')
+                mask.append(True)
+            except InvalidJWSSignature:
+                mask.append(False)
+
+    report('{} documents, one at a time'.format(count),
+           _time(one_at_a_time, repeat))
+    report('{} documents, verify_batch'.format(count),
+           _time(lambda: verify_batch(column, 'signature'), repeat))
+
+
+@benchmark
+def bench_deadlines(cheap: int = 400, expensive: int = 40) -> None:
+    """
+    A batch mixing cheap ES256 documents with P-521 chains
+    under a common deadline: in order, and scheduled.
+    """
+    from random import Random
+    from time import monotonic
+    from jsf import JSF, JWK
+    from jsf.batch import ErrorCode, verify_batch
+
+    eckey = JWK.generate(kty='EC', crv='P-256')
+    p521key = JWK.generate(kty='EC', crv='P-521')
+    column = []
+    for i in range(cheap + expensive):
+        jsf = JSF({'id': i})
+        if i < cheap:
+            jsf.add_single_signature('signature', eckey, 'ES256', {
+                'publicKey': eckey.export_public(True)})
+        else:
+            for _ in range(5):
+                jsf.add_chain_signature('signature', p521key, 'ES512', {
+                    'publicKey': p521key.export_public(True)})
+        column.append(jsf.payload)
+    Random(0).shuffle(column)
+
+    start = perf_counter()
+    verify_batch(column, 'signature')
+    budget = (perf_counter() - start) / 3
+
+    start = perf_counter()
+    deadline = monotonic() + budget
+    in_time = 0
+    for document in column:
+        verify_batch([document], 'signature')
+        in_time += monotonic() <= deadline
+    report('{} documents in order, {} in time'.format(len(column), in_time),
+           perf_counter() - start)
+
+    start = perf_counter()
+    _, errors = verify_batch(column, 'signature',
+                             deadlines=monotonic() + budget)
+    report('{} documents scheduled, {} in time'.format(
+        len(column), sum(code != ErrorCode.DEADLINE for code in errors)),
+        perf_counter() - start)
+
+
+@benchmark
+def bench_archive(count: int = 2000, size: int = 2000) -> None:
+    """
+    Re-verifying single entries of an archive, against reading
+    the documents from a JSON Lines file up to the entry,
+    and a full sweep of the archive.
+    """
+    import json
+    import os
+    from tempfile import TemporaryDirectory
+    from jsf import JSF, JWK
+    from jsf.archive import ArchiveReader, ArchiveWriter
+
+    key = JWK.generate(kty='EC', crv='P-256')
+    header = {'publicKey': key.export_public(True)}
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'audit.jsfa')
+        lines = os.path.join(tmp, 'audit.jsonl')
+        with ArchiveWriter(path) as writer, open(lines, 'w') as f:
+            for i in range(count):
+                jsf = JSF({'id': i, 'data': 'x' * size})
+                jsf.add_single_signature('signature', key, 'ES256', header)
+                writer.append(jsf)
+                f.write(json.dumps(jsf.payload) + '\n')
+        entries = range(count // 2, count, count // 20)
+
+        def from_lines() -> None:
+            for entry in entries:
+                with open(lines) as f:
+                    for i, line in enumerate(f):
+                        document = json.loads(line)
+                        if i == entry:
+                            break
+                JSF(document).verify('signature')
+
+        start = perf_counter()
+        from_lines()
+        report('{} entries from JSON Lines'.format(len(entries)),
+               perf_counter() - start)
+
+        with ArchiveReader(path) as reader:
+            start = perf_counter()
+            for entry in entries:
+                reader.verify(entry)
+            report('{} entries from the archive'.format(len(entries)),
+                   perf_counter() - start)
+            for workers in sorted({1, os.cpu_count() or 1}):
+                start = perf_counter()
+                reader.sweep(workers)
+                report('sweep of {} entries, {} workers'.format(
+                    count, workers), perf_counter() - start)
+
+
+@benchmark
+def bench_merkle(count: int = 1000) -> None:
+    """
+    Signing and verifying records one at a time,
+    and as a batch signed over their Merkle tree.
+    """
+    from jsf import JSF, JWK
+    from jsf.merkle import MerkleJSF, sign_batch
+
+    key = JWK.generate(kty='RSA', size=3072)
+    header = {'publicKey': key.export_public(True)}
+
+    def records() -> List[Dict[str, object]]:
+        return [{'id': i, 'name': 'record', 'tags': ['a', 'b']}
+                for i in range(count)]
+
+    payloads = records()
+    start = perf_counter()
+    for payload in payloads:
+        JSF(payload).add_single_signature('signature', key, 'RS256', header)
+    report('{} records signed one at a time'.format(count),
+           perf_counter() - start)
+    start = perf_counter()
+    for payload in payloads:
+        JSF(payload).verify('signature')
+    report('{} records verified one at a time'.format(count),
+           perf_counter() - start)
+
+    payloads = records()
+    start = perf_counter()
+    sign_batch(payloads, 'signature', key, 'RS256', header)
+    report('{} records signed as a batch'.format(count),
+           perf_counter() - start)
+    start = perf_counter()
+    for payload in payloads:
+        MerkleJSF(payload).verify('signature')
+    report('{} records of a batch verified'.format(count),
+           perf_counter() - start)
+
+
+@benchmark
+def bench_policy(count: int = 2000) -> None:
+    """
+    Handling documents on an internal hop: verifying all of them,
+    one in ten, and deferring the rest to a background thread.
+    """
+    from jsf import JSF, JWK
+    from jsf.policy import VerificationPolicy
+
+    key = JWK.generate(kty='EC', crv='P-256')
+    header = {'publicKey': key.export_public(True)}
+    documents = []
+    for i in range(count):
+        jsf = JSF({'id': i, 'name': 'hop'})
+        jsf.add_single_signature('signature', key, 'ES256', header)
+        documents.append(jsf.payload)
+
+    for name, policy in [
+            ('verified', VerificationPolicy()),
+            ('sampled 1 in 10', VerificationPolicy(sample=10)),
+            ('sampled 1 in 10, deferred',
+             VerificationPolicy(sample=10, defer=True, queue_size=count))]:
+        start = perf_counter()
+        for document in documents:
+            jsf = JSF(document)
+            policy.verify(jsf, 'signature')
+            jsf.payload
+        report('{} documents {}'.format(count, name), perf_counter() - start)
+        policy.close()
+
+
+@benchmark
+def bench_revalidate(count: int = 2000, keys: int = 20) -> None:
+    """
+    Re-verifying what one of many keys signed:
+    every document, and those the signer index points to.
+    """
+    import os
+    from tempfile import TemporaryDirectory
+    from jsf import JSF, JWK
+    from jsf.index import SignerIndex
+
+    signing_keys = [JWK.generate(kty='EC', crv='P-256', kid=str(i))
+                    for i in range(keys)]
+    documents = {}
+    for i in range(count):
+        key = signing_keys[i % keys]
+        jsf = JSF({'id': i})
+        jsf.add_single_signature('signature', key, 'ES256', {
+            'publicKey': key.export_public(True), 'keyId': key['kid']})
+        documents[str(i)] = jsf.payload
+
+    with TemporaryDirectory() as tmp:
+        with SignerIndex(os.path.join(tmp, 'signers')) as index:
+            for name, document in documents.items():
+                index.verify(JSF(document), 'signature', name)
+
+            start = perf_counter()
+            for document in documents.values():
+                jsf = JSF(document)
+                jsf.verify('signature')
+                jsf.report.entries[0].key_id == '0'
+            report('{} documents re-verified'.format(count),
+                   perf_counter() - start)
+
+            start = perf_counter()
+            revalidated = list(index.revalidate('0', documents.__getitem__))
+            report('{} documents of the key re-verified'.format(
+                len(revalidated)), perf_counter() - start)
+
+
+@benchmark
+def bench_stream(count: int = 20000) -> None:
+    """
+    Signing a large generated document and writing it to a file:
+    built in memory and signed by `JSF`, and streamed by `StreamSigner`,
+    with the peak memory allocated.
+    """
+    import os
+    from tempfile import TemporaryDirectory
+    import tracemalloc
+    from jsf import JSF, JWK
+    from jsf.stream import StreamSigner
+
+    key = JWK.generate(kty='EC', crv='P-256')
+
+    def rows() -> Iterator[Dict[str, object]]:
+        for i in range(count):
+            yield {'id': i, 'name': 'row {}'.format(i), 'amount': i * 0.5}
+
+    with TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'export.json')
+
+        def in_memory() -> None:
+            jsf = JSF({'name': 'export', 'rows': list(rows())})
+            jsf.add_single_signature('signature', key, 'ES256')
+            with open(path, 'wb') as f:
+                f.write(jsf.canonical)
+
+        def streamed() -> None:
+            with open(path, 'wb') as f, \
+                    StreamSigner(f, 'signature', key, 'ES256') as signer:
+                signer.member('name', 'export')
+                signer.member('rows', rows())
+
+        for name, run in [('in memory', in_memory), ('streamed', streamed)]:
+            tracemalloc.start()
+            start = perf_counter()
+            run()
+            elapsed = perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            report('{} rows {}, peak {:.1f} MB'.format(
+                count, name, peak / 1e6), elapsed)
+
+
+def main(names: List[str]) -> None:
+    for name in names or BENCHMARKS:
+        print('#', name)
+        BENCHMARKS[name]()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,914 @@
+"""
+The jsf module attempts to implement
+the [JSON Signature Format draft 0.81][1].
+
+JWCrypto (and through it, the cryptography package) and the canonicalizer
+are only imported when a signature is first created or verified,
+so that importing this module stays cheap.
+The JWCrypto names re-exported from here are resolved on first access.
+
+[1]: https://cyberphone.github.io/doc/security/jsf.html
+"""
+
+from copy import copy
+from enum import Enum
+from functools import lru_cache
+from importlib import import_module
+from time import perf_counter
+from typing import (
+    TYPE_CHECKING, Any, Callable, Dict, FrozenSet, Iterator, List, Mapping,
+    Optional, Tuple, Type, Union)
+
+from .canonical import (
+    CanonicalizationError, Canonicalizer, RecordView, is_record)
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+_LAZY_IMPORTS = {
+    'base64url_decode': 'jwcrypto.common',
+    'base64url_encode': 'jwcrypto.common',
+    'json_decode': 'jwcrypto.common',
+    'json_encode': 'jwcrypto.common',
+    'JWK': 'jwcrypto.jwk',
+    'InvalidJWSObject': 'jwcrypto.jws',
+    'InvalidJWSOperation': 'jwcrypto.jws',
+    'InvalidJWSSignature': 'jwcrypto.jws',
+    'JWSCore': 'jwcrypto.jws',
+    'JWSHeaderRegistry': 'jwcrypto.jws',
+    'default_allowed_algs': 'jwcrypto.jws',
+}
+
+
+def __getattr__(name: str) -> Any:
+    if name in _LAZY_IMPORTS:
+        value = getattr(import_module(_LAZY_IMPORTS[name]), name)
+    elif name == 'VerificationFailed':
+        value = _verification_failed()
+    elif name == 'PrevalidationFailed':
+        value = _prevalidation_failed()
+    else:
+        raise AttributeError(
+            'module {!r} has no attribute {!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_LAZY_IMPORTS)
+                  | {'VerificationFailed', 'PrevalidationFailed'})
+
+
+JsonObject = Dict[str, Any]
+"""
+A Python dictionary representing a JSON object.
+
+This type alias is more for documentation than type checking,
+as mypy currently does not support recursive data types:
+https://github.com/python/mypy/issues/731
+"""
+
+
+AlgorithmName = str
+"""
+An algorithm name, as understood by the JWCrypto library.
+"""
+
+
+_ALGORITHM = 'algorithm'
+_PUBLICKEY = 'publicKey'
+_VALUE = 'value'
+_EXTENSIONS = 'extensions'
+_EXCLUDES = 'excludes'
+_SIGNERS = 'signers'
+_CHAIN = 'chain'
+_KEYID = 'keyId'
+
+
+# The key types and curves (None for any) of the algorithms
+_KEY_TYPES = {
+    'HS256': ('oct', None), 'HS384': ('oct', None), 'HS512': ('oct', None),
+    'RS256': ('RSA', None), 'RS384': ('RSA', None), 'RS512': ('RSA', None),
+    'PS256': ('RSA', None), 'PS384': ('RSA', None), 'PS512': ('RSA', None),
+    'ES256': ('EC', 'P-256'), 'ES384': ('EC', 'P-384'),
+    'ES512': ('EC', 'P-521'), 'ES256K': ('EC', 'secp256k1'),
+    'EdDSA': ('OKP', None), 'Ed25519': ('OKP', 'Ed25519'),
+    'Ed448': ('OKP', 'Ed448'),
+}
+
+# The raw signature lengths of the algorithms (and EdDSA curves)
+# having a fixed one
+_SIGNATURE_LENGTHS = {
+    'HS256': 32, 'HS384': 48, 'HS512': 64,
+    'ES256': 64, 'ES384': 96, 'ES512': 132, 'ES256K': 64,
+    'Ed25519': 64, 'Ed448': 114,
+}
+
+
+_PreparePayloadHeader = Callable[[JsonObject], JsonObject]
+_InstallPayloadHeader = Callable[[JsonObject], None]
+_PatchHeader = Callable[[JsonObject], JsonObject]
+
+
+# A canonical object is assembled from its canonical members,
+# so that a single member (usually the signature object)
+# can be replaced without serializing the rest of the object again.
+_Members = Dict[str, bytes]
+
+
+def _hash_name(alg: AlgorithmName) -> str:
+    # The hash function of the algorithm,
+    # or SHA-256 for algorithms without one (EdDSA)
+    return 'sha' + alg[-3:] if alg[-3:] in ('256', '384', '512') else 'sha256'
+
+
+def _format_error(error: Type[Exception], args: Tuple[Any, ...]) -> str:
+    return '{}({})'.format(error.__name__, ', '.join(map(repr, args)))
+
+
+class SignerResult:
+    """
+    The outcome of verifying a single signer.
+
+    Only the exception class and arguments are kept, not the exception
+    itself, so that its traceback (and the payload copies it references)
+    can be released.
+    """
+
+    __slots__ = ('index', 'ok', 'error', 'error_args', 'key_id', 'elapsed')
+
+    def __init__(self, index: int, ok: bool,
+                 error: Optional[Type[Exception]],
+                 error_args: Tuple[Any, ...],
+                 key_id: Optional[str], elapsed: float) -> None:
+        self.index = index
+        self.ok = ok
+        self.error = error
+        self.error_args = error_args
+        self.key_id = key_id
+        self.elapsed = elapsed
+
+    def __repr__(self) -> str:
+        if self.ok:
+            return 'Passed: [{}]'.format(self.index)
+        return 'Failed: [{}]'.format(
+            _format_error(self.error, self.error_args))
+
+
+class VerificationPath(Enum):
+    """
+    How the signatures of a document were handled,
+    as recorded in `JSF.verification_path`.
+    """
+    VERIFIED = 'verified'
+    """Verified by `JSF.verify`."""
+    SKIPPED = 'skipped'
+    """Trusted without verification, by a `jsf.policy` policy."""
+    DEFERRED = 'deferred'
+    """Trusted until verified in the background, by a `jsf.policy` policy."""
+
+
+class VerificationReport:
+    """
+    Per-signer results of the last `JSF.verify` call.
+
+    At most `max_entries` results are kept; the rest are only counted.
+    Nothing is formatted until the report is rendered.
+    """
+
+    max_entries = 16
+
+    def __init__(self, max_entries: Optional[int] = None) -> None:
+        if max_entries is not None:
+            self.max_entries = max_entries
+        self.entries: List[SignerResult] = []
+        self.passed = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def dropped(self) -> int:
+        """The number of results counted but not kept."""
+        return self.passed + self.failed - len(self.entries)
+
+    def add(self, index: int, error: Optional[Exception],
+            key_id: Optional[str], elapsed: float) -> None:
+        if error is None:
+            self.passed += 1
+        else:
+            self.failed += 1
+        self.elapsed += elapsed
+        if len(self.entries) < self.max_entries:
+            self.entries.append(SignerResult(
+                index, error is None,
+                None if error is None else type(error),
+                () if error is None else error.args,
+                key_id, elapsed))
+
+    def failures(self) -> Iterator[SignerResult]:
+        return (r for r in self.entries if not r.ok)
+
+    @property
+    def messages(self) -> List[str]:
+        """The kept failures, formatted one per line."""
+        return [repr(r) for r in self.failures()]
+
+    def __len__(self) -> int:
+        return self.passed + self.failed
+
+    def __str__(self) -> str:
+        messages = self.messages
+        if self.dropped:
+            messages.append('... {} more'.format(self.dropped))
+        return repr(messages)
+
+
+@lru_cache(maxsize=None)
+def _verification_failed() -> Type[Exception]:
+    # Subclassing InvalidJWSSignature needs JWCrypto,
+    # so the class is created on first use.
+    from jwcrypto.jws import InvalidJWSSignature
+
+    class VerificationFailed(InvalidJWSSignature):
+        """
+        Raised by `JSF.verify` when no signature could be verified.
+
+        The report is only rendered into the message when it is read.
+        """
+
+        def __init__(self, report: VerificationReport) -> None:
+            super().__init__('Verification failed for all signatures')
+            self.report = report
+
+        def __str__(self) -> str:
+            return '{} {}'.format(self.args[0], self.report)
+
+        def __reduce__(self) -> Tuple[Any, ...]:
+            return type(self), (self.report,)
+
+    # Pickled by reference to the module attribute,
+    # as when raised in another process
+    VerificationFailed.__module__ = __name__
+    VerificationFailed.__qualname__ = VerificationFailed.__name__
+    return VerificationFailed
+
+
+@lru_cache(maxsize=None)
+def _prevalidation_failed() -> Type[Exception]:
+    from jwcrypto.jws import InvalidJWSSignature
+
+    class PrevalidationFailed(InvalidJWSSignature):
+        """
+        Raised when a signature or a payload is rejected
+        by the cheap checks `JSF.verify` makes
+        before canonicalizing the payload.
+
+        :param reason: What was rejected: one of
+        `"algorithm"`, `"signature"`, `"key"`, `"extension"` and `"payload"`.
+        """
+
+        def __init__(self, reason: str, message: str,
+                     exception: Optional[Exception] = None) -> None:
+            super().__init__(message, exception)
+            self.reason = reason
+
+        def __reduce__(self) -> Tuple[Any, ...]:
+            # The message already includes the exception
+            return type(self), (self.reason, self.args[0])
+
+    PrevalidationFailed.__module__ = __name__
+    PrevalidationFailed.__qualname__ = PrevalidationFailed.__name__
+    return PrevalidationFailed
+
+
+def _rsa_key_size(key: Mapping[str, Any]) -> int:
+    from jwcrypto.common import base64url_decode
+    modulus = base64url_decode(key['n']).lstrip(b'\0')
+    return (len(modulus) - 1) * 8 + modulus[0].bit_length() if modulus else 0
+
+
+class SigningRequest:
+    """
+    A signature to be computed by a key holder.
+
+    Only `algorithm` and `digest` need to reach the key holder;
+    the request itself is handed back to `JSF.finalize_signature`
+    together with the raw signature.
+    """
+
+    def __init__(self, algorithm: AlgorithmName, header: JsonObject,
+                 canonical: bytes, prop: str, members: _Members,
+                 install: _InstallPayloadHeader) -> None:
+        self.algorithm = algorithm
+        self.header = header
+        self.canonical = canonical
+        self._prop = prop
+        self._members = members
+        self._install = install
+        self._digest: Optional[bytes] = None
+
+    @property
+    def digest(self) -> bytes:
+        """
+        The digest of the canonical signing input,
+        using the hash function of `algorithm`.
+        """
+        from hashlib import new
+        if self._digest is None:
+            self._digest = new(_hash_name(self.algorithm),
+                               self.canonical).digest()
+        return self._digest
+
+
+def _can_prehash(alg: AlgorithmName) -> bool:
+    from jwcrypto.jwa import JWA
+    engine = JWA.signing_alg(alg)
+    return hasattr(engine, 'padfn') or hasattr(engine, 'curve')
+
+
+def sign_digest(key: 'JWK', alg: AlgorithmName, digest: bytes) -> bytes:
+    """
+    Sign a prehashed `digest`, as produced by `SigningRequest.digest`.
+    This only needs the private `key`, not the payload.
+
+    :param alg: An ECDSA, RSASSA-PKCS1-v1_5 or RSASSA-PSS algorithm.
+
+    :returns: The raw signature, as `JSF.finalize_signature` expects it.
+    """
+    from cryptography.hazmat.primitives.asymmetric import ec, utils
+    from jwcrypto.jwa import JWA
+    from jwcrypto.jws import InvalidJWSOperation
+
+    engine = JWA.signing_alg(alg)
+    prehashed = utils.Prehashed(engine.hashfn)
+    if hasattr(engine, 'padfn'):
+        return key.get_op_key('sign').sign(digest, engine.padfn, prehashed)
+    if hasattr(engine, 'curve'):
+        skey = key.get_op_key('sign', engine.curve)
+        r, s = utils.decode_dss_signature(
+            skey.sign(digest, ec.ECDSA(prehashed)))
+        size = (skey.key_size + 7) // 8
+        return r.to_bytes(size, 'big') + s.to_bytes(size, 'big')
+    raise InvalidJWSOperation(
+        'Algorithm "{}" cannot sign a prehashed digest'.format(alg))
+
+
+class JSF:
+    canonicalizer = Canonicalizer()
+    """
+    The canonical JSON serializer.
+    Replace with one having limits to bound the work done
+    on untrusted payloads; `verify` checks the payload
+    against them before serializing it.
+    """
+
+    _report_class: Callable[[], VerificationReport] = VerificationReport
+    # Whether `verify` keeps what `canonical` needs
+    _keep_canonical = True
+
+    supported_extensions: FrozenSet[str] = frozenset()
+    """
+    The extensions this class implements, besides those of the JWS
+    header registry; subclasses declaring one also handle it
+    when signing or verifying.
+    """
+
+    min_rsa_key_size = 2048
+    max_rsa_key_size = 16384
+    """
+    The range of RSA key sizes, in bits, accepted by `verify`.
+    Verification time grows with the key size.
+    """
+
+    def __init__(self, payload: Optional[JsonObject] = None) -> None:
+        """
+        Create a JSF object.
+
+        :param payload: The payload object.
+        Dataclass and attrs instances are signed and verified directly,
+        their fields being the object members; the signature property
+        must then be one of the fields.
+        """
+        self._payload = payload
+        # The payload, as a mapping
+        self._doc = RecordView(payload) if is_record(payload) else payload
+        self.report = self._report_class()
+        self._allowed_algs: Optional[List[AlgorithmName]] = None
+        self._members: Optional[_Members] = None
+        self._signed: Optional[Tuple[AlgorithmName, bytes]] = None
+        self._valid = False
+        self.verification_path: Optional[VerificationPath] = None
+        """
+        How the signatures were last handled, if at all.
+        The payload of a document skipped or deferred by a policy
+        is available without verification.
+        """
+
+    def _check_extensions(self, extensions):
+        from jwcrypto.jws import JWSHeaderRegistry
+        for k in extensions:
+            if k in self.supported_extensions:
+                continue
+            if k not in JWSHeaderRegistry:
+                raise _prevalidation_failed()(
+                    'extension', 'Unknown extension: "{}"'.format(k))
+            elif not JWSHeaderRegistry[k][1]:
+                raise _prevalidation_failed()(
+                    'extension', 'Unsupported extension: "{}"'.format(k))
+
+    @property
+    def allowed_algs(self) -> List[AlgorithmName]:
+        from jwcrypto.jws import default_allowed_algs
+        return (self._allowed_algs if self._allowed_algs is not None
+                else default_allowed_algs)
+
+    @allowed_algs.setter
+    def allowed_algs(self, algs: List[AlgorithmName]) -> None:
+        if (not isinstance(algs, list) or
+                not all(isinstance(alg, AlgorithmName)
+                        for alg in algs)):
+            raise TypeError('Allowed Algs must be a list of strings')
+        self._allowed_algs = algs
+
+    @property
+    def is_valid(self) -> bool:
+        return self._valid
+
+    @property
+    def payload(self) -> JsonObject:
+        from jwcrypto.jws import InvalidJWSOperation
+        if self._payload is None:
+            raise InvalidJWSOperation("Payload not available")
+        if (self.verification_path not in (VerificationPath.SKIPPED,
+                                           VerificationPath.DEFERRED) and
+                not self.is_valid):
+            raise InvalidJWSOperation("Payload not verified")
+        return self._payload
+
+    @property
+    def verifylog(self) -> List[str]:
+        """
+        The failures of the last `verify` call, formatted.
+        Prefer `report`, which does not format anything.
+        """
+        return self.report.messages
+
+    @property
+    def canonical(self) -> bytes:
+        """
+        The canonical form of the signed document,
+        as of the last successful signature or verification.
+        """
+        from jwcrypto.jws import InvalidJWSOperation
+        if self._members is None:
+            raise InvalidJWSOperation("Signed document not available")
+        return self.canonicalizer.join_members(self._members)
+
+    @property
+    def digest(self) -> bytes:
+        """
+        The digest of the canonical signing input covered by the last
+        signature created or verified, using the hash function
+        of its algorithm (SHA-256 for EdDSA).
+        """
+        from hashlib import new
+        from jwcrypto.jws import InvalidJWSOperation
+        if self._signed is None:
+            raise InvalidJWSOperation("Signing input not available")
+        alg, canonical = self._signed
+        return new(_hash_name(alg), canonical).digest()
+
+    def _get_alg(self, alg: Optional[AlgorithmName],
+                 header: JsonObject, error: Type[Exception]) -> AlgorithmName:
+        h_alg = header.get(_ALGORITHM)
+        if alg is None:
+            if h_alg is None:
+                raise error('No "{}" in headers'.format(_ALGORITHM))
+            return h_alg
+        if h_alg is not None and alg != h_alg:
+            raise error(
+                '"{}" mismatch, requested "{}", found "{}"'
+                .format(_ALGORITHM, alg, h_alg))
+        return alg
+
+    def _prepare_signature(
+            self, prop: str, alg: Optional[AlgorithmName],
+            header: Optional[JsonObject],
+            prepare_payload_header: _PreparePayloadHeader,
+            install_payload_header: _InstallPayloadHeader
+            ) -> 'SigningRequest':
+        from jwcrypto.common import json_decode, json_encode
+        from jwcrypto.jws import InvalidJWSObject
+
+        if self._payload is None:
+            raise InvalidJWSObject('Missing Payload')
+
+        # Check the header round-trips through JSON
+        h = json_decode(json_encode(header or {}))
+
+        self._check_extensions(h.get(_EXTENSIONS, []))
+
+        a = self._get_alg(alg, h, ValueError)
+
+        # Prepare payload for signature algorithm
+        h.setdefault(_ALGORITHM, a)
+        h.pop(_VALUE, None)
+        members = self.canonicalizer.dump_members(self._payload)
+        members[prop] = self.canonicalizer.dump_member(
+            prop, prepare_payload_header(h))
+        return SigningRequest(
+            a, h, self.canonicalizer.join_members(members),
+            prop, members, install_payload_header)
+
+    def _install_signature(self, request: 'SigningRequest',
+                           signature: bytes) -> None:
+        from jwcrypto.common import base64url_encode
+
+        # Put signature in place
+        h = copy(request.header)
+        h[_VALUE] = base64url_encode(signature)
+        request._install(h)
+        members = request._members
+        members[request._prop] = self.canonicalizer.dump_member(
+            request._prop, self._doc[request._prop])
+        self._members = members
+        self._signed = request.algorithm, request.canonical
+        self._valid = True
+
+    def _add_signature(
+            self, prop: str, key: 'JWK', alg: Optional[AlgorithmName],
+            header: Optional[JsonObject],
+            prepare_payload_header: _PreparePayloadHeader,
+            install_payload_header: _InstallPayloadHeader) -> None:
+        from jwcrypto.jws import JWSCore
+
+        request = self._prepare_signature(prop, alg, header,
+                                          prepare_payload_header,
+                                          install_payload_header)
+
+        # Calculate signature
+        #
+        # JWSCore would encode payload as base64 and prepend a dot,
+        # but Cleartext JWS uses canonicalized JSON as Signing Input,
+        # so we just use Core for its algorithm engine selection logic.
+        c = JWSCore(request.algorithm, key, header=None, payload='',
+                    algs=self.allowed_algs)
+        self._install_signature(request,
+                                c.engine.sign(key, request.canonical))
+
+    def _prepare_prehashed(
+            self, prop: str, alg: Optional[AlgorithmName],
+            header: Optional[JsonObject],
+            prepare_payload_header: _PreparePayloadHeader,
+            install_payload_header: _InstallPayloadHeader
+            ) -> 'SigningRequest':
+        from jwcrypto.jws import InvalidJWSOperation
+
+        request = self._prepare_signature(prop, alg, header,
+                                          prepare_payload_header,
+                                          install_payload_header)
+        if request.algorithm not in self.allowed_algs:
+            raise InvalidJWSOperation('Algorithm not allowed')
+        if not _can_prehash(request.algorithm):
+            raise InvalidJWSOperation(
+                'Algorithm "{}" cannot sign a prehashed digest'
+                .format(request.algorithm))
+        return request
+
+    def _single(self, prop: str
+                ) -> Tuple[_PreparePayloadHeader, _InstallPayloadHeader]:
+        return (lambda h: h,
+                lambda h: self._doc.update({prop: h}))
+
+    def _multiple(self, prop: str
+                  ) -> Tuple[_PreparePayloadHeader, _InstallPayloadHeader]:
+        top_level_signature = self._doc.get(prop) or {}
+        for k in list(top_level_signature):
+            if k != _SIGNERS:
+                del top_level_signature[k]
+        return (lambda h: {_SIGNERS: [h]},
+                lambda h: (self._doc
+                               .setdefault(prop, {})
+                               .setdefault(_SIGNERS, [])
+                               .append(h)))
+
+    def _chain(self, prop: str
+               ) -> Tuple[_PreparePayloadHeader, _InstallPayloadHeader]:
+        top_level_signature = self._doc.get(prop) or {}
+        for k in list(top_level_signature):
+            if k != _CHAIN:
+                del top_level_signature[k]
+        chain = top_level_signature.get(_CHAIN, [])
+        return (lambda h: {_CHAIN: chain + [h]},
+                lambda h: (self._doc
+                               .setdefault(prop, {})
+                               .setdefault(_CHAIN, [])
+                               .append(h)))
+
+    def add_single_signature(
+            self, prop: str, key: 'JWK', alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> None:
+        """
+        Sign the payload with a single `key`.
+        Remove any previously added signatures.
+
+        :param prop: Place the signature object into this top-level property.
+
+        :param alg: The signing algorithm.
+        Can be omitted if provided in the `header`.
+
+        :param header: The header providing the algorithm parameters.
+        """
+        self._add_signature(prop, key, alg, header, *self._single(prop))
+
+    def add_signature(
+            self, prop: str, key: 'JWK', alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> None:
+        """
+        Add a signature using the specified key and algorithm.
+        Remove the signatures added by `add_single_signature`
+        or `add_chain_signature`, if any.
+        This method can be used multiple times.
+
+        :param alg: The signing algorithm.
+        Can be omitted if provided in the `header`.
+
+        :param header: The header providing the algorithm parameters.
+        """
+        self._add_signature(prop, key, alg, header, *self._multiple(prop))
+
+    def add_chain_signature(
+            self, prop: str, key: 'JWK', alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> None:
+        """
+        Add a signature to the chain using the specified key and algorithm.
+        Remove the signatures added by `add_single_signature`
+        or `add_signature`, if any.
+        This method can be used multiple times.
+
+        :param alg: The signing algorithm.
+        Can be omitted if provided in the `header`.
+
+        :param header: The header providing the algorithm parameters.
+        """
+        self._add_signature(prop, key, alg, header, *self._chain(prop))
+
+    def prepare_single_signature(
+            self, prop: str, alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> 'SigningRequest':
+        """
+        Canonicalize and hash the payload for signing by a key holder,
+        like `add_single_signature` but without the key.
+        Pass the raw signature over `SigningRequest.digest`
+        (see `sign_digest`) to `finalize_signature`.
+
+        Only the ECDSA, RSASSA-PKCS1-v1_5 and RSASSA-PSS algorithms
+        can sign a prehashed digest.
+        """
+        return self._prepare_prehashed(prop, alg, header,
+                                       *self._single(prop))
+
+    def prepare_signature(
+            self, prop: str, alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> 'SigningRequest':
+        """
+        Like `prepare_single_signature`, for `add_signature`.
+        """
+        return self._prepare_prehashed(prop, alg, header,
+                                       *self._multiple(prop))
+
+    def prepare_chain_signature(
+            self, prop: str, alg: Optional[AlgorithmName] = None,
+            header: Optional[JsonObject] = None) -> 'SigningRequest':
+        """
+        Like `prepare_single_signature`, for `add_chain_signature`.
+        """
+        return self._prepare_prehashed(prop, alg, header,
+                                       *self._chain(prop))
+
+    def finalize_signature(self, request: 'SigningRequest',
+                           signature: bytes,
+                           key: Optional['JWK'] = None) -> None:
+        """
+        Put the signature computed for a prepared `request` in place.
+
+        :param signature: The raw signature over `request.digest`.
+
+        :param key: If specified, check the signature
+        with this (public) key first.
+
+        :raises InvalidJWSSignature: if the signature does not verify.
+        """
+        from jwcrypto.jws import InvalidJWSSignature, JWSCore
+
+        if key is not None:
+            c = JWSCore(request.algorithm, key, header=None, payload='',
+                        algs=self.allowed_algs)
+            try:
+                c.engine.verify(key, request.canonical, signature)
+            except Exception as e:
+                raise InvalidJWSSignature('Verification failed', e)
+        self._install_signature(request, signature)
+
+    def _verify(self, prop: str, key: 'JWK', alg: Optional[AlgorithmName],
+                header: JsonObject, signer: Optional[JsonObject],
+                patch_header: _PatchHeader, members: _Members) -> None:
+        from jwcrypto.common import base64url_decode
+        from jwcrypto.jwk import JWK
+        from jwcrypto.jws import InvalidJWSSignature, JWSCore
+
+        a = self._get_alg(alg, signer or header, InvalidJWSSignature)
+
+        # Prepare payload for verification algorithm
+        payload = copy(members)
+        h = copy(header)
+        s = copy(signer)
+        signature = base64url_decode((s or h).pop(_VALUE))
+        exclude = h.pop(_EXCLUDES, [])
+        for x in exclude:
+            payload.pop(x, None)
+
+        h.update(patch_header(s))
+
+        payload[prop] = self.canonicalizer.dump_member(prop, h)
+        canonical = self.canonicalizer.join_members(payload)
+
+        # Verify signature
+        if key is None:
+            key = JWK(**((s or h).get(_PUBLICKEY, None)))
+        c = JWSCore(a, key, header=None, payload='',
+                    algs=self._allowed_algs)
+        c.engine.verify(key, canonical, signature)
+        self._signed = a, canonical
+
+    def _prevalidate(self, key: Optional['JWK'],
+                     alg: Optional[AlgorithmName], header: JsonObject,
+                     signer: Optional[JsonObject]) -> None:
+        # Checks needing neither the payload nor any cryptography
+        from jwcrypto.jws import InvalidJWSSignature
+
+        rejected = _prevalidation_failed()
+        if signer is not None and not isinstance(signer, dict):
+            raise rejected('signature', 'Signer is not an object')
+        s = signer or header
+        a = self._get_alg(alg, s, InvalidJWSSignature)
+        if a not in self.allowed_algs:
+            raise rejected('algorithm', 'Algorithm "{}" not allowed'.format(a))
+
+        public_key = key if key is not None else s.get(_PUBLICKEY)
+        length = _SIGNATURE_LENGTHS.get(a)
+        if public_key is not None and not isinstance(public_key, Mapping):
+            raise rejected('key', 'Invalid public key')
+        if public_key is not None:
+            kty, crv = _KEY_TYPES.get(a, (None, None))
+            if kty is not None and public_key.get('kty') != kty:
+                raise rejected('key', 'Key type "{}" cannot verify "{}"'
+                               .format(public_key.get('kty'), a))
+            if crv is not None and public_key.get('crv') != crv:
+                raise rejected('key', 'Curve "{}" cannot verify "{}"'
+                               .format(public_key.get('crv'), a))
+            if kty == 'RSA':
+                try:
+                    size = _rsa_key_size(public_key)
+                except Exception as e:
+                    raise rejected('key', 'Invalid RSA key', e)
+                if not self.min_rsa_key_size <= size <= self.max_rsa_key_size:
+                    raise rejected('key', 'RSA key size {} not allowed'
+                                   .format(size))
+                length = (size + 7) // 8
+            elif kty == 'OKP':
+                length = _SIGNATURE_LENGTHS.get(public_key.get('crv'))
+
+        value = s.get(_VALUE)
+        if not isinstance(value, str):
+            raise rejected('signature', 'Missing signature value')
+        # The decoded length of unpadded base64url
+        if length is not None and len(value) * 3 // 4 != length:
+            raise rejected('signature',
+                           'Signature length {} invalid for "{}"'
+                           .format(len(value) * 3 // 4, a))
+
+    def _report(self, index: int, key: Optional['JWK'], h: JsonObject,
+                signer: Optional[JsonObject], error: Optional[Exception],
+                elapsed: float) -> None:
+        s = signer or h
+        key_id = (key.get('kid') if key is not None
+                  else s.get(_KEYID) if isinstance(s, dict) else None)
+        self.report.add(index, error, key_id, elapsed)
+
+    def _try_verify(self, index: int, prop: str, key: Optional['JWK'],
+                    alg: Optional[AlgorithmName],
+                    h: JsonObject, signer: Optional[JsonObject],
+                    patch_header: _PatchHeader, members: _Members) -> None:
+        error = None
+        start = perf_counter()
+        try:
+            self._verify(prop, key, alg, h, signer, patch_header, members)
+            self._valid = True
+        except Exception as e:
+            error = e
+        self._report(index, key, h, signer, error, perf_counter() - start)
+
+    def verify(self, prop: str, key: Optional['JWK'] = None,
+               alg: Optional[AlgorithmName] = None) -> None:
+        """
+        Verify signatures on the payload using `key`.
+
+        :param prop: The name of the top-level property in payload
+        that contains the signatures.
+        The JSF specification does not specify this property,
+        saying it is arbitrary but unique.
+        This library assumes each application will pick a sensible name.
+
+        :param key: The verification key. If not specified, the key
+        from the payload’s signature object will be used (if any).
+
+        :param alg: The signing algorithm. Usually it is known
+        from the payload’s header.
+
+        :raises VerificationFailed: if the verification fails.
+        The per-signer results are also available in `report`.
+
+        :raises PrevalidationFailed: if the extensions or the payload
+        are rejected before any signature is verified.
+        Signers rejected early are reported as failures
+        with this exception.
+
+        :raises InvalidJWSSignature: if the signature object is unusable.
+        """
+        from jwcrypto.jws import InvalidJWSSignature
+
+        self.report = self._report_class()
+        self._valid = False
+        self._members = self._signed = None
+        self.verification_path = None
+        h = self._doc.get(prop)
+        if h is None:
+            raise InvalidJWSSignature('No signatures available')
+        if not isinstance(h, dict):
+            raise InvalidJWSSignature('Signature object is not an object')
+
+        self._check_extensions(h.get(_EXTENSIONS, []))
+
+        signers: List[Optional[JsonObject]] = (
+            h[_SIGNERS] if _SIGNERS in h
+            else h[_CHAIN] if _CHAIN in h
+            else [None])
+        if not isinstance(signers, list):
+            raise InvalidJWSSignature('Signers are not an array')
+
+        # Reject what can be rejected cheaply before any heavy work
+        rejected: Dict[int, Tuple[Exception, float]] = {}
+        for i, signer in enumerate(signers):
+            start = perf_counter()
+            try:
+                self._prevalidate(key, alg, h, signer)
+            except InvalidJWSSignature as e:
+                rejected[i] = e, perf_counter() - start
+            except Exception as e:
+                # Whatever the checks trip over rejects the signer only
+                rejected[i] = (_prevalidation_failed()(
+                    'signature', 'Invalid signer', e),
+                    perf_counter() - start)
+        if len(rejected) == len(signers) or (_CHAIN in h and rejected):
+            for i, (error, elapsed) in rejected.items():
+                self._report(i, key, h, signers[i], error, elapsed)
+            raise _verification_failed()(self.report)
+
+        # The payload members are serialized once for all signers
+        try:
+            self.canonicalizer.check_limits(self._payload, skip=prop)
+            members = self.canonicalizer.dump_members(self._payload,
+                                                      skip=prop)
+        except (ValueError, TypeError) as e:
+            # Beyond the limits, or no JSON at all (NaN, cycles, objects)
+            raise _prevalidation_failed()('payload', 'Payload rejected', e)
+
+        for i, signer in enumerate(signers):
+            if i in rejected:
+                self._report(i, key, h, signer, *rejected[i])
+            elif signer is None:
+                self._try_verify(i, prop, key, alg, h, None, lambda _s: {},
+                                 members)
+            elif _SIGNERS in h:
+                # A multiple signature is valid if any signature is valid
+                self._try_verify(i, prop, key, alg, h, signer,
+                                 lambda s: {_SIGNERS: [s]}, members)
+            else:
+                # A chain signature is valid if all signatures are valid
+                # and there is at least one
+                self._try_verify(i, prop, key, alg, h, signer,
+                                 lambda s: {_CHAIN: h[_CHAIN][:i] + [s]},
+                                 members)
+        if _CHAIN in h:
+            self._valid = not self.report.failed
+
+        if not self.is_valid:
+            self._signed = None
+            raise _verification_failed()(self.report)
+        self.verification_path = VerificationPath.VERIFIED
+
+        if self._keep_canonical:
+            members[prop] = self.canonicalizer.dump_member(prop, h)
+            self._members = members
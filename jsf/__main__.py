@@ -0,0 +1,157 @@
+"""
+Command line entry points:
+
+    python -m jsf serve [--host HOST] [--port PORT] [--keys JWKS] ...
+    python -m jsf index ARCHIVE [--index INDEX] [--keys JWKS]
+    python -m jsf revalidate ARCHIVE --key=KEY [--index INDEX]
+                             [--keys JWKS] [--revoked]
+
+See `python -m jsf COMMAND --help`.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+def _serve(args: argparse.Namespace) -> None:
+    from .server import KeyCache, VerificationService, start_server
+
+    keys = KeyCache.load(args.keys) if args.keys else KeyCache()
+    service = VerificationService(
+        keys, workers=args.workers, max_batch=args.max_batch,
+        max_delay=args.max_delay, queue_size=args.queue_size,
+        timeout=args.timeout)
+
+    async def run() -> None:
+        server = await start_server(service, host=args.host, port=args.port,
+                                    max_body=args.max_body)
+        print('Serving on {}'.format(', '.join(
+            '{}:{}'.format(*s.getsockname()[:2]) for s in server.sockets)),
+            file=sys.stderr)
+        try:
+            await server.serve_forever()
+        finally:
+            server.close()
+            await service.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+def _index_path(args: argparse.Namespace) -> str:
+    return args.index or args.archive + '.signers'
+
+
+def _keys(args: argparse.Namespace) -> Dict[str, 'JWK']:
+    from .server import KeyCache
+    return KeyCache.load(args.keys).keys if args.keys else {}
+
+
+def _index(args: argparse.Namespace) -> None:
+    from jwcrypto.jws import InvalidJWSSignature
+    from . import JSF
+    from .archive import ArchiveReader
+    from .index import SignerIndex, _verification_key
+
+    keys = _keys(args)
+    invalid = 0
+    with ArchiveReader(args.archive) as reader, \
+            SignerIndex(_index_path(args)) as index:
+        for i in range(len(reader)):
+            prop = reader.metadata(i)['property']
+            jsf = JSF(reader.document(i))
+            try:
+                index.verify(jsf, prop, str(i),
+                             _verification_key(jsf._doc, prop, keys))
+            except InvalidJWSSignature:
+                invalid += 1
+    print('Indexed {} documents, {} invalid'.format(len(reader), invalid),
+          file=sys.stderr)
+
+
+def _revalidate(args: argparse.Namespace) -> None:
+    from .archive import ArchiveReader
+    from .index import SignerIndex
+
+    invalid = 0
+    with ArchiveReader(args.archive) as reader, \
+            SignerIndex(_index_path(args)) as index:
+        for document, valid in index.revalidate(
+                args.key, lambda document: reader.document(int(document)),
+                _keys(args), [args.key] if args.revoked else ()):
+            invalid += not valid
+            print(json.dumps({'document': document, 'valid': valid}))
+    if invalid:
+        sys.exit(1)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m jsf')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser(
+        'serve', help='Serve the /verify, /sign and /metrics endpoints')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8080)
+    serve.add_argument('--keys', metavar='JWKS',
+                       help='A JWK Set file of the keys, with key ids')
+    serve.add_argument('--workers', type=int, default=4,
+                       help='The number of worker threads')
+    serve.add_argument('--max-batch', type=int, default=32,
+                       help='The maximum number of requests per batch')
+    serve.add_argument('--max-delay', type=float, default=0.002,
+                       help='How long a batch waits for more requests, '
+                            'in seconds')
+    serve.add_argument('--queue-size', type=int, default=1024,
+                       help='The maximum number of requests waiting '
+                            'before new ones are refused')
+    serve.add_argument('--timeout', type=float,
+                       help='The timeout of requests not setting one, '
+                            'in seconds')
+    serve.add_argument('--max-body', type=int, default=1 << 20,
+                       help='The maximum size of a request body, in bytes')
+    serve.set_defaults(run=_serve)
+
+    index = commands.add_parser(
+        'index', help='Verify the documents of an archive, '
+                      'recording their signers in an index')
+    index.add_argument('archive', help='A jsf.archive archive')
+    index.add_argument('--index', help='The signer index database, '
+                                       'by default ARCHIVE.signers')
+    index.add_argument('--keys', metavar='JWKS',
+                       help='A JWK Set file of the keys of the signatures '
+                            'without an embedded key')
+    index.set_defaults(run=_index)
+
+    revalidate = commands.add_parser(
+        'revalidate', help='Re-verify the documents of an archive '
+                           'signed by a key, printing their verdicts')
+    revalidate.add_argument('archive', help='A jsf.archive archive')
+    # Thumbprints may start with "-", which only --key=KEY takes
+    revalidate.add_argument('--key', required=True,
+                            help='The key id or thumbprint, '
+                                 'as --key=KEY')
+    revalidate.add_argument('--index', help='The signer index database, '
+                                            'by default ARCHIVE.signers')
+    revalidate.add_argument('--keys', metavar='JWKS',
+                            help='A JWK Set file of the keys of the '
+                                 'signatures without an embedded key')
+    revalidate.add_argument('--revoked', action='store_true',
+                            help='Count the signatures of the key '
+                                 'as failures')
+    revalidate.set_defaults(run=_revalidate)
+
+    args = parser.parse_args(argv)
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,383 @@
+"""
+An append-only archive of signed documents, for audit trails.
+
+An archive is a data file and an index file next to it
+(`<path>.idx`). The data file holds, for each document:
+its canonical form, as signed and verified,
+metadata describing its signers, and the SHA-256 digest of both,
+so that storage corruption can be found without verifying signatures.
+The index holds the offset of each entry,
+so that any entry is found without reading the others.
+
+    header:  b'JSFARCH1'
+    entry:   canonical length (uint32), metadata length (uint32),
+             SHA-256 digest of the canonical form and metadata (32 bytes),
+             canonical form, metadata (JSON)
+
+    index header: b'JSFINDX1'
+    index entry:  entry offset (uint64), canonical length (uint32),
+                  metadata length (uint32)
+
+All integers are little-endian.
+Entries are only ever appended; an entry is written to the data file
+before the index, and `ArchiveWriter` restores index entries missing
+after a crash, and truncates any partially written entry.
+
+`ArchiveReader` maps both files in memory:
+reading or verifying an entry only touches the pages holding it.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+import json
+import mmap
+import os
+import struct
+from typing import (
+    TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple, Union)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, _ALGORITHM, _CHAIN, _KEYID, _PUBLICKEY,
+    _SIGNERS)
+from .batch import BatchResult, ErrorCode, _result, verify_batch
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+_MAGIC = b'JSFARCH1'
+_INDEX_MAGIC = b'JSFINDX1'
+_ENTRY = struct.Struct('<II32s')
+_INDEX_ENTRY = struct.Struct('<QII')
+
+
+def index_path(path: str) -> str:
+    return path + '.idx'
+
+
+def signer_metadata(document: JsonObject, prop: str) -> JsonObject:
+    """
+    The metadata of the signers of `document`, as archived:
+    `{"property": ..., "mode": "single" | "multiple" | "chain",
+    "signers": [{"algorithm": ..., "keyId": ..., "thumbprint": ...}]}`,
+    the thumbprint being the RFC 7638 thumbprint of the public key
+    in the signature object, if any.
+    """
+    from jwcrypto.jwk import JWK
+
+    h = document.get(prop)
+    if not isinstance(h, dict):
+        return {'property': prop, 'mode': None, 'signers': []}
+    if _SIGNERS in h:
+        mode, signers = 'multiple', h[_SIGNERS]
+    elif _CHAIN in h:
+        mode, signers = 'chain', h[_CHAIN]
+    else:
+        mode, signers = 'single', [h]
+    metadata = []
+    for signer in signers:
+        public_key = signer.get(_PUBLICKEY, h.get(_PUBLICKEY))
+        thumbprint = None
+        if isinstance(public_key, dict):
+            try:
+                thumbprint = JWK(**public_key).thumbprint()
+            except Exception:
+                pass
+        metadata.append({
+            'algorithm': signer.get(_ALGORITHM, h.get(_ALGORITHM)),
+            'keyId': signer.get(_KEYID, h.get(_KEYID)),
+            'thumbprint': thumbprint,
+        })
+    return {'property': prop, 'mode': mode, 'signers': metadata}
+
+
+class ArchiveWriter:
+    """
+    Append signed documents to the archive at `path`,
+    creating it if needed.
+
+    :param prop: The signature property of the documents.
+
+    :param verify: Whether to verify documents before archiving them.
+    """
+
+    def __init__(self, path: str, prop: str = 'signature',
+                 verify: bool = False) -> None:
+        self.path = path
+        self.prop = prop
+        self.verify = verify
+        self._data = open(path, 'a+b')
+        self._index = open(index_path(path), 'a+b')
+        if self._data.seek(0, os.SEEK_END) == 0:
+            self._data.write(_MAGIC)
+            self._data.flush()
+        if self._index.seek(0, os.SEEK_END) == 0:
+            self._index.write(_INDEX_MAGIC)
+            self._index.flush()
+        self._recover()
+
+    def _recover(self) -> None:
+        # Index the entries written after the last indexed one,
+        # and drop a trailing partial entry
+        data_size = self._data.seek(0, os.SEEK_END)
+        index_size = self._index.seek(0, os.SEEK_END)
+        count = (index_size - len(_INDEX_MAGIC)) // _INDEX_ENTRY.size
+        self._index.truncate(len(_INDEX_MAGIC) + count * _INDEX_ENTRY.size)
+        end = len(_MAGIC)
+        if count:
+            self._index.seek(len(_INDEX_MAGIC) +
+                             (count - 1) * _INDEX_ENTRY.size)
+            offset, length, meta_length = _INDEX_ENTRY.unpack(
+                self._index.read(_INDEX_ENTRY.size))
+            end = offset + _ENTRY.size + length + meta_length
+        if end > data_size:
+            raise ValueError('Index of {} is ahead of its data'
+                             .format(self.path))
+        self._count = count
+        while end + _ENTRY.size <= data_size:
+            self._data.seek(end)
+            length, meta_length, _ = _ENTRY.unpack(
+                self._data.read(_ENTRY.size))
+            if end + _ENTRY.size + length + meta_length > data_size:
+                break
+            self._index.seek(0, os.SEEK_END)
+            self._index.write(_INDEX_ENTRY.pack(end, length, meta_length))
+            self._count += 1
+            end += _ENTRY.size + length + meta_length
+        self._data.truncate(end)
+        self._data.flush()
+        self._index.flush()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def append(self, document: Union[JsonObject, JSF],
+               prop: Optional[str] = None) -> int:
+        """
+        Archive a signed document, given as an object or a `JSF`
+        that signed or verified it.
+
+        :returns: The index of the new entry.
+
+        :raises VerificationFailed: if verifying and the document
+        does not verify.
+        """
+        prop = prop or self.prop
+        if isinstance(document, JSF):
+            canonical = document.canonical
+            payload = document.payload
+        elif self.verify:
+            jsf = JSF(document)
+            jsf.verify(prop)
+            canonical = jsf.canonical
+            payload = document
+        else:
+            canonical = JSF.canonicalizer.dumps(document)
+            payload = document
+        metadata = json.dumps(signer_metadata(payload, prop),
+                              separators=(',', ':')).encode('utf-8')
+        digest = sha256(canonical)
+        digest.update(metadata)
+        offset = self._data.seek(0, os.SEEK_END)
+        self._data.write(_ENTRY.pack(len(canonical), len(metadata),
+                                     digest.digest()))
+        self._data.write(canonical)
+        self._data.write(metadata)
+        self._data.flush()
+        self._index.write(_INDEX_ENTRY.pack(offset, len(canonical),
+                                            len(metadata)))
+        self._index.flush()
+        self._count += 1
+        return self._count - 1
+
+    def sync(self) -> None:
+        """
+        Flush the archive to stable storage.
+        """
+        os.fsync(self._data.fileno())
+        os.fsync(self._index.fileno())
+
+    def close(self) -> None:
+        self._data.close()
+        self._index.close()
+
+    def __enter__(self) -> 'ArchiveWriter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+class ArchiveReader:
+    """
+    Read and verify the entries of the archive at `path`.
+    Entries appended after the reader was opened are not seen.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with open(index_path(path), 'rb') as f:
+            self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if (self._data[:len(_MAGIC)] != _MAGIC or
+                self._index[:len(_INDEX_MAGIC)] != _INDEX_MAGIC):
+            raise ValueError('Not a JSF archive: {}'.format(path))
+        self._count = ((len(self._index) - len(_INDEX_MAGIC))
+                       // _INDEX_ENTRY.size)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _entry(self, i: int) -> Tuple[int, int, int]:
+        if not -self._count <= i < self._count:
+            raise IndexError('Archive entry {} out of range'.format(i))
+        return _INDEX_ENTRY.unpack_from(
+            self._index, len(_INDEX_MAGIC) + (i % self._count)
+            * _INDEX_ENTRY.size)
+
+    def canonical(self, i: int) -> memoryview:
+        """
+        The canonical form of entry `i`, without copying it.
+        """
+        offset, length, _ = self._entry(i)
+        start = offset + _ENTRY.size
+        return memoryview(self._data)[start:start + length]
+
+    def _body(self, i: int) -> memoryview:
+        # The canonical form and the metadata, which follows it
+        offset, length, meta_length = self._entry(i)
+        start = offset + _ENTRY.size
+        return memoryview(self._data)[start:start + length + meta_length]
+
+    def digest(self, i: int) -> bytes:
+        """
+        The SHA-256 digest of the canonical form and the metadata
+        of entry `i`, as archived.
+        """
+        offset, _, _ = self._entry(i)
+        return _ENTRY.unpack_from(self._data, offset)[2]
+
+    def metadata(self, i: int) -> JsonObject:
+        """
+        The signer metadata of entry `i` (see `signer_metadata`).
+        """
+        offset, length, meta_length = self._entry(i)
+        start = offset + _ENTRY.size + length
+        return json.loads(self._data[start:start + meta_length]
+                          .decode('utf-8'))
+
+    def document(self, i: int) -> JsonObject:
+        return json.loads(bytes(self.canonical(i)).decode('utf-8'))
+
+    def __iter__(self) -> Iterator[JsonObject]:
+        return (self.document(i) for i in range(self._count))
+
+    def check(self, i: int) -> bool:
+        """
+        Whether the canonical form and the metadata of entry `i`
+        still match their digest, without verifying signatures.
+        """
+        return sha256(self._body(i)).digest() == self.digest(i)
+
+    def verify(self, i: int, key: Optional['JWK'] = None,
+               alg: Optional[AlgorithmName] = None) -> ErrorCode:
+        """
+        Verify the signatures of entry `i`.
+        """
+        if not -self._count <= i < self._count:
+            raise IndexError('Archive entry {} out of range'.format(i))
+        i %= self._count
+        return ErrorCode(self.verify_range(i, i + 1, key, alg,
+                                           numpy=False).errors[0])
+
+    def verify_range(self, start: int = 0, stop: Optional[int] = None,
+                     key: Optional['JWK'] = None,
+                     alg: Optional[AlgorithmName] = None,
+                     numpy: Optional[bool] = None) -> BatchResult:
+        """
+        Verify the signatures of entries `start` to `stop`,
+        as `verify_batch`.
+        Entries that do not match their digest, or whose metadata
+        is unusable, are reported as `ErrorCode.MALFORMED`.
+        """
+        start, stop, _ = slice(start, stop).indices(self._count)
+        rows: List[Optional[bytes]] = []
+        props: List[Optional[str]] = []
+        for i in range(start, stop):
+            row = prop = None
+            if self.check(i):
+                try:
+                    prop = self.metadata(i)['property']
+                except (ValueError, TypeError, KeyError):
+                    pass
+                else:
+                    row = bytes(self.canonical(i))
+            rows.append(row)
+            props.append(prop)
+        errors = bytearray()
+        if len(set(props) - {None}) <= 1:
+            prop = next((p for p in props if p is not None), '')
+            errors = verify_batch(rows, prop, key, alg, numpy=False).errors
+        else:
+            # Mixed signature properties, verified one at a time
+            for row, prop in zip(rows, props):
+                errors += verify_batch([row], prop or '', key, alg,
+                                       numpy=False).errors
+        return _result(errors, numpy)
+
+    def sweep(self, workers: Optional[int] = None,
+              key: Optional['JWK'] = None,
+              alg: Optional[AlgorithmName] = None,
+              chunk_size: int = 1000,
+              numpy: Optional[bool] = None) -> BatchResult:
+        """
+        Verify all entries, in chunks of `chunk_size` entries
+        verified in parallel by `workers` processes
+        (by default, one per CPU).
+        Each process maps the archive itself.
+        """
+        ranges = [(start, min(start + chunk_size, self._count))
+                  for start in range(0, self._count, chunk_size)]
+        key_params = dict(key) if key is not None else None
+        errors = bytearray()
+        if workers == 1 or len(ranges) <= 1:
+            for start, stop in ranges:
+                errors += self.verify_range(start, stop, key, alg,
+                                            numpy=False).errors
+        else:
+            with ProcessPoolExecutor(workers) as executor:
+                for chunk in executor.map(
+                        _verify_chunk,
+                        *zip(*((self.path, start, stop, key_params, alg)
+                               for start, stop in ranges))):
+                    errors += chunk
+        return _result(errors, numpy)
+
+    def close(self) -> None:
+        self._index.close()
+        try:
+            self._data.close()
+        except BufferError:
+            # Views returned by `canonical` are still in use;
+            # the mapping is closed once they are gone
+            pass
+
+    def __enter__(self) -> 'ArchiveReader':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+
+def _verify_chunk(path: str, start: int, stop: int,
+                  key_params: Optional[Dict[str, Any]],
+                  alg: Optional[AlgorithmName]) -> bytearray:
+    # Runs in a worker process
+    key = None
+    if key_params is not None:
+        from jwcrypto.jwk import JWK
+        key = JWK(**key_params)
+    with ArchiveReader(path) as reader:
+        return reader.verify_range(start, stop, key, alg,
+                                   numpy=False).errors
@@ -0,0 +1,224 @@
+"""
+Verification of many documents at once,
+with results as arrays rather than exceptions.
+
+`verify_batch` takes a column of documents and returns a validity mask
+and an error code per document. No exception reaches the caller
+for an invalid document, and no result object is kept per document;
+the public keys embedded in the documents are parsed once per batch.
+
+Only the API is free of exceptions: each document is still verified
+by a `JSF` object, and one that fails still raises and catches
+an exception internally, since the cryptographic backend reports
+a signature that does not verify by raising.
+
+With deadlines, documents are verified in the order given by
+`jsf.schedule.plan`, and those that cannot be verified in time
+are skipped and reported with `ErrorCode.DEADLINE`.
+"""
+
+from enum import IntEnum
+import json
+from typing import (
+    TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Sequence,
+    Union)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, VerificationReport, _CHAIN, _PUBLICKEY,
+    _SIGNERS, _prevalidation_failed)
+from .schedule import CostModel, default_model, plan, run_planned
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+class ErrorCode(IntEnum):
+    """
+    Why a document failed verification.
+    """
+    VALID = 0
+    INVALID = 1
+    """A signature does not verify."""
+    MALFORMED = 2
+    """The document or its signature object is unusable."""
+    ALGORITHM = 3
+    """The algorithm is not allowed."""
+    SIGNATURE = 4
+    """The signature value has the wrong length."""
+    KEY = 5
+    """The key does not fit the algorithm."""
+    EXTENSION = 6
+    """An extension is unknown or unsupported."""
+    PAYLOAD = 7
+    """The payload exceeds the limits of the canonicalizer."""
+    DEADLINE = 8
+    """Skipped, as it could not be verified before its deadline."""
+
+
+_REASON_CODES = {
+    'algorithm': ErrorCode.ALGORITHM,
+    'signature': ErrorCode.SIGNATURE,
+    'key': ErrorCode.KEY,
+    'extension': ErrorCode.EXTENSION,
+    'payload': ErrorCode.PAYLOAD,
+}
+
+
+def _error_code(error: Exception) -> ErrorCode:
+    from cryptography.exceptions import InvalidSignature
+    if isinstance(error, _prevalidation_failed()):
+        return _REASON_CODES[error.reason]
+    if isinstance(error, InvalidSignature):
+        return ErrorCode.INVALID
+    return ErrorCode.MALFORMED
+
+
+class _RowReport(VerificationReport):
+    # Keeps the code of the first failure, and nothing else
+    max_entries = 0
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.code = ErrorCode.VALID
+
+    def add(self, index: int, error: Optional[Exception],
+            key_id: Optional[str], elapsed: float) -> None:
+        super().add(index, error, key_id, elapsed)
+        if error is not None and not self.code:
+            self.code = _error_code(error)
+
+
+class _RowJSF(JSF):
+    _report_class = _RowReport
+    _keep_canonical = False
+
+
+class BatchResult(NamedTuple):
+    """
+    The results of `verify_batch`, one item per document:
+    NumPy arrays if NumPy is available, else byte arrays.
+    """
+    mask: Any
+    """Whether the document is valid (bool, or 0 and 1)."""
+    errors: Any
+    """The `ErrorCode` of the document (uint8)."""
+
+
+def _rows(column: Any) -> Iterable[Any]:
+    # Arrow arrays and chunked arrays are converted a chunk at a time
+    chunks = getattr(column, 'chunks', None)
+    if chunks is not None:
+        for chunk in chunks:
+            yield from chunk.to_pylist()
+    elif hasattr(column, 'to_pylist'):
+        yield from column.to_pylist()
+    else:
+        yield from column
+
+
+def _parse_row(row: Any) -> Optional[JsonObject]:
+    if isinstance(row, (str, bytes, bytearray)):
+        try:
+            row = json.loads(row)
+        except ValueError:
+            return None
+    return row if isinstance(row, dict) else None
+
+
+def _verify_row(row: Optional[JsonObject], prop: str, key: Optional['JWK'],
+                alg: Optional[AlgorithmName],
+                allowed_algs: Optional[List[AlgorithmName]],
+                keys: Dict[str, 'JWK']) -> ErrorCode:
+    from jwcrypto.jws import InvalidJWSSignature
+
+    if row is None:
+        return ErrorCode.MALFORMED
+
+    signature = row.get(prop)
+    if (key is None and isinstance(signature, dict) and
+            _SIGNERS not in signature and _CHAIN not in signature and
+            isinstance(signature.get(_PUBLICKEY), dict)):
+        name = json.dumps(signature[_PUBLICKEY], sort_keys=True)
+        key = keys.get(name)
+        if key is None:
+            from jwcrypto.jwk import JWK
+            try:
+                key = keys[name] = JWK(**signature[_PUBLICKEY])
+            except Exception:
+                return ErrorCode.KEY
+
+    jsf = _RowJSF(row)
+    if allowed_algs is not None:
+        jsf.allowed_algs = allowed_algs
+    try:
+        jsf.verify(prop, key=key, alg=alg)
+    except InvalidJWSSignature as e:
+        return jsf.report.code or _error_code(e)
+    except Exception:
+        return ErrorCode.MALFORMED
+    return ErrorCode.VALID
+
+
+def verify_batch(column: Any, prop: str, key: Optional['JWK'] = None,
+                 alg: Optional[AlgorithmName] = None,
+                 allowed_algs: Optional[List[AlgorithmName]] = None,
+                 numpy: Optional[bool] = None,
+                 deadlines: Union[None, float,
+                                  Sequence[Optional[float]]] = None,
+                 model: Optional[CostModel] = None) -> BatchResult:
+    """
+    Verify the signatures in `prop` of each document of `column`,
+    like `JSF.verify`.
+
+    :param column: The documents: a sequence, a NumPy object array
+    or an Arrow array, of objects or of their JSON text.
+
+    :param allowed_algs: As `JSF.allowed_algs`.
+
+    :param numpy: Whether to return NumPy arrays;
+    by default, if NumPy can be imported.
+
+    :param deadlines: The deadline of each document,
+    on the `time.monotonic` clock, or None;
+    or a single deadline for all of them.
+
+    :param model: The cost model to schedule with,
+    by default `jsf.schedule.default_model`.
+    """
+    # Public keys found in the documents, by their JSON text
+    keys: Dict[str, 'JWK'] = {}
+    if deadlines is None:
+        errors = bytearray(_verify_row(_parse_row(row), prop, key, alg,
+                                       allowed_algs, keys)
+                           for row in _rows(column))
+    else:
+        rows = [_parse_row(row) for row in _rows(column)]
+        if isinstance(deadlines, (int, float)):
+            deadlines = [deadlines] * len(rows)
+        if model is None:
+            model = default_model
+        costs = [model.estimate(row, prop, key, alg)
+                 if row is not None else 0.0 for row in rows]
+        errors = bytearray([ErrorCode.DEADLINE]) * len(rows)
+
+        def run(i: int) -> None:
+            errors[i] = _verify_row(rows[i], prop, key, alg, allowed_algs,
+                                    keys)
+
+        order, _ = plan([cost * model.scale for cost in costs], deadlines)
+        run_planned(order, costs, deadlines, run, model)
+    return _result(errors, numpy)
+
+
+def _result(errors: bytearray, numpy: Optional[bool]) -> BatchResult:
+    mask = bytearray(not code for code in errors)
+    if numpy is not False:
+        try:
+            import numpy as np
+        except ImportError:
+            if numpy:
+                raise
+        else:
+            return BatchResult(np.frombuffer(mask, dtype=np.bool_),
+                               np.frombuffer(errors, dtype=np.uint8))
+    return BatchResult(mask, errors)
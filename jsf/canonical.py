@@ -0,0 +1,609 @@
+"""
+Canonical JSON serialization, as specified by [RFC 8785][1],
+using an explicit stack instead of recursion.
+
+Nesting costs no Python frames, so deeply nested documents
+cannot raise `RecursionError` halfway through a signature,
+and a `Canonicalizer` with limits rejects documents exceeding them
+as soon as the limit is crossed, before serializing the rest.
+
+Besides the JSON types, dataclass and attrs instances are serialized
+as objects whose members are their fields,
+straight from their attributes.
+
+Member order and encoded member names are computed once per shape
+(the tuple of member names of an object) and cached,
+which removes most of the cost not spent on values
+when serializing many objects with the same members.
+
+Documents wrapped with `track` remember the canonical form
+of each of their arrays and objects until they are modified,
+so serializing them again after a small edit
+only walks the modified subtrees.
+
+[1]: https://www.rfc-editor.org/rfc/rfc8785
+"""
+
+from json.encoder import encode_basestring
+from typing import (
+    Any, Dict, Iterable, Iterator, List, Mapping, MutableMapping, NamedTuple,
+    Optional, Tuple)
+
+
+# Integers below this magnitude have the same ES6 and Python forms
+_MAX_EXACT_INT = 2 ** 53
+
+_END = object()
+
+
+class CanonicalizationError(ValueError):
+    """
+    Raised when a value exceeds the limits of a `Canonicalizer`.
+    """
+
+
+def _encode_name(name: str) -> str:
+    if not isinstance(name, str):
+        raise TypeError('Object keys must be strings, not {}'
+                        .format(type(name).__name__))
+    return encode_basestring(name) + ':'
+
+
+def _es6_number(value: Any) -> str:
+    from org.webpki.json.NumberToJson import convert2Es6Format
+    return convert2Es6Format(value)
+
+
+# Member names in canonical order, with their encoded `"name":` prefixes
+_Plan = List[Tuple[str, str]]
+
+
+def _compile_plan(names: Iterator[str]) -> _Plan:
+    # Member names are sorted by their UTF-16 code units
+    return sorted(((name, _encode_name(name)) for name in names),
+                  key=lambda plan: plan[0].encode('utf-16-be'))
+
+
+_record_plans: Dict[type, _Plan] = {}
+
+
+def _record_fields(cls: type) -> Optional[List[str]]:
+    if hasattr(cls, '__dataclass_fields__'):
+        from dataclasses import fields
+        return [f.name for f in fields(cls)]
+    attributes = getattr(cls, '__attrs_attrs__', None)
+    if attributes is not None:
+        return [a.name for a in attributes]
+    return None
+
+
+def _record_plan(cls: type) -> Optional[_Plan]:
+    # Compiled once per class
+    plan = _record_plans.get(cls)
+    if plan is None:
+        names = _record_fields(cls)
+        if names is None:
+            return None
+        plan = _record_plans[cls] = _compile_plan(iter(names))
+    return plan
+
+
+def _record_items(record: Any, plan: _Plan) -> Iterator[Tuple[str, Any]]:
+    for name, prefix in plan:
+        yield prefix, getattr(record, name)
+
+
+def _object_items(obj: Mapping[str, Any],
+                  plan: _Plan) -> Iterator[Tuple[str, Any]]:
+    for name, prefix in plan:
+        yield prefix, obj[name]
+
+
+def is_record(obj: Any) -> bool:
+    """
+    Whether `obj` is a dataclass or attrs instance.
+    """
+    return not isinstance(obj, type) and _record_plan(type(obj)) is not None
+
+
+class RecordView(MutableMapping):
+    """
+    A mapping view of the fields of a record,
+    for signing and verifying records in place.
+    Fields set to None read as missing.
+    Fields can be set but not deleted.
+    """
+
+    def __init__(self, record: Any) -> None:
+        self.record = record
+        self._names = [name for name, _ in _record_plan(type(record))]
+
+    def __getitem__(self, name: str) -> Any:
+        value = (getattr(self.record, name) if name in self._names
+                 else None)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name: str, value: Any) -> None:
+        if name not in self._names:
+            raise KeyError('{} has no field {!r}'
+                           .format(type(self.record).__name__, name))
+        setattr(self.record, name, value)
+
+    def __delitem__(self, name: str) -> None:
+        raise TypeError('Record fields cannot be deleted')
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+
+class _Tracked:
+    # The parent container, to invalidate when this one is modified
+    _parent: Optional['_Tracked'] = None
+    # The canonical form and height of the container, if still valid
+    _fragment: Optional[Tuple[str, int]] = None
+
+    def _touch(self) -> None:
+        # A container is only cached along with all of its descendants,
+        # so the ancestors of a modified container need invalidating
+        # up to the first one not cached.
+        node: Optional[_Tracked] = self
+        while node is not None and node._fragment is not None:
+            node._fragment = None
+            node = node._parent
+
+    def _adopt(self, value: Any) -> Any:
+        if isinstance(value, _Tracked) and value._parent in (None, self):
+            value._parent = self
+            return value
+        if isinstance(value, dict):
+            tracked: _Tracked = TrackedDict()
+            dict.update(tracked, ((k, tracked._adopt(v))
+                                  for k, v in value.items()))
+        elif isinstance(value, (list, tuple)):
+            tracked = TrackedList()
+            list.extend(tracked, (tracked._adopt(v) for v in value))
+        else:
+            return value
+        tracked._parent = self
+        return tracked
+
+
+class TrackedDict(_Tracked, dict):
+    """
+    A dict that keeps the canonical form of its contents
+    until it is modified. Create with `track`.
+    Values are tracked as they are inserted.
+    """
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self._touch()
+        dict.__setitem__(self, key, self._adopt(value))
+
+    def __delitem__(self, key: str) -> None:
+        self._touch()
+        dict.__delitem__(self, key)
+
+    def clear(self) -> None:
+        self._touch()
+        dict.clear(self)
+
+    def pop(self, *args: Any) -> Any:
+        self._touch()
+        return dict.pop(self, *args)
+
+    def popitem(self) -> Tuple[str, Any]:
+        self._touch()
+        return dict.popitem(self)
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args: Any, **kwargs: Any) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __ior__(self, other: Any) -> 'TrackedDict':
+        self.update(other)
+        return self
+
+
+class TrackedList(_Tracked, list):
+    """
+    A list that keeps the canonical form of its contents
+    until it is modified. Create with `track`.
+    Items are tracked as they are inserted.
+    """
+
+    def __setitem__(self, index: Any, value: Any) -> None:
+        self._touch()
+        if isinstance(index, slice):
+            value = [self._adopt(v) for v in value]
+        else:
+            value = self._adopt(value)
+        list.__setitem__(self, index, value)
+
+    def __delitem__(self, index: Any) -> None:
+        self._touch()
+        list.__delitem__(self, index)
+
+    def __iadd__(self, other: Iterable[Any]) -> 'TrackedList':
+        self.extend(other)
+        return self
+
+    def __imul__(self, n: int) -> 'TrackedList':
+        self._touch()
+        items = list(self)
+        list.clear(self)
+        for _ in range(n):
+            list.extend(self, (self._adopt(v) for v in items))
+        return self
+
+    def append(self, value: Any) -> None:
+        self._touch()
+        list.append(self, self._adopt(value))
+
+    def extend(self, values: Iterable[Any]) -> None:
+        self._touch()
+        list.extend(self, [self._adopt(v) for v in values])
+
+    def insert(self, index: int, value: Any) -> None:
+        self._touch()
+        list.insert(self, index, self._adopt(value))
+
+    def pop(self, *args: Any) -> Any:
+        self._touch()
+        return list.pop(self, *args)
+
+    def remove(self, value: Any) -> None:
+        self._touch()
+        list.remove(self, value)
+
+    def clear(self) -> None:
+        self._touch()
+        list.clear(self)
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self._touch()
+        list.sort(self, *args, **kwargs)
+
+    def reverse(self) -> None:
+        self._touch()
+        list.reverse(self)
+
+
+def track(obj: Any) -> Any:
+    """
+    Copy the arrays and objects of `obj`
+    into a `TrackedDict` or `TrackedList` tree.
+
+    Serializing the tree again reuses the canonical form
+    of each array and object not modified since,
+    so re-signing a large document after a small edit
+    costs in proportion to the edit.
+    Records inside the tree are not tracked,
+    so their ancestors are always serialized again.
+    """
+    if isinstance(obj, _Tracked):
+        return obj
+    tracked = _Tracked()._adopt(obj)
+    if isinstance(tracked, _Tracked):
+        tracked._parent = None
+    return tracked
+
+
+class ShapeCacheInfo(NamedTuple):
+    """
+    Statistics of the shape cache of a `Canonicalizer`.
+    """
+    hits: int
+    misses: int
+    evictions: int
+    size: int
+    maxsize: int
+
+
+class Canonicalizer:
+    """
+    A canonical JSON serializer with optional limits.
+
+    :param max_depth: The maximum nesting depth of arrays and objects.
+
+    :param max_size: The maximum length of the output, in characters.
+
+    :param shape_cache_size: The maximum number of object shapes to cache;
+    the oldest one is evicted first. Zero disables the cache.
+
+    :param max_shape_members: Objects with more members than this
+    are not cached, as they are unlikely to repeat.
+    """
+
+    def __init__(self, max_depth: Optional[int] = None,
+                 max_size: Optional[int] = None,
+                 shape_cache_size: int = 256,
+                 max_shape_members: int = 64) -> None:
+        self.max_depth = max_depth
+        self.max_size = max_size
+        self.shape_cache_size = shape_cache_size
+        self.max_shape_members = max_shape_members
+        self._shapes: Dict[Tuple[str, ...], _Plan] = {}
+        self._hits = self._misses = self._evictions = 0
+
+    def shape_cache_info(self) -> ShapeCacheInfo:
+        return ShapeCacheInfo(self._hits, self._misses, self._evictions,
+                              len(self._shapes), self.shape_cache_size)
+
+    def shape_cache_clear(self) -> None:
+        self._shapes.clear()
+        self._hits = self._misses = self._evictions = 0
+
+    def _shape_plan(self, obj: Mapping[str, Any]) -> _Plan:
+        if len(obj) > self.max_shape_members or not self.shape_cache_size:
+            return _compile_plan(iter(obj))
+        shape = tuple(obj)
+        plan = self._shapes.get(shape)
+        if plan is not None:
+            self._hits += 1
+            return plan
+        self._misses += 1
+        plan = _compile_plan(iter(shape))
+        if len(self._shapes) >= self.shape_cache_size:
+            try:
+                del self._shapes[next(iter(self._shapes))]
+                self._evictions += 1
+            except (KeyError, RuntimeError, StopIteration):
+                # Another thread got there first
+                pass
+        self._shapes[shape] = plan
+        return plan
+
+    def dumps(self, obj: Any) -> bytes:
+        """
+        Serialize `obj` to canonical UTF-8 encoded JSON.
+
+        :raises CanonicalizationError: if `obj` exceeds the limits.
+
+        :raises TypeError: if `obj` contains non-JSON values.
+        """
+        return self._encode(obj, 0, self.max_size).encode('utf-8')
+
+    def dump_member(self, name: str, value: Any) -> bytes:
+        """
+        Serialize a single object member to its canonical `"name":value`
+        form.
+        """
+        budget = None if self.max_size is None else self.max_size - 2
+        return self._encode(value, 1, budget,
+                            _encode_name(name)).encode('utf-8')
+
+    def dump_members(self, obj: Any,
+                     skip: Optional[str] = None) -> Dict[str, bytes]:
+        """
+        Serialize each member of `obj`, an object or a record,
+        except `skip`, to its canonical `"name":value` form.
+        The limits apply to `obj` as a whole.
+        """
+        if isinstance(obj, RecordView):
+            obj = obj.record
+        if isinstance(obj, dict):
+            plan = self._shape_plan(obj)
+            get = obj.__getitem__
+        else:
+            plan = _record_plan(type(obj))
+            if plan is None:
+                raise TypeError("Object of type '{}' is not a JSON object"
+                                .format(type(obj).__name__))
+            get = obj.__getattribute__
+        budget = None if self.max_size is None else self.max_size - 2
+        members = {}
+        for name, prefix in plan:
+            if name == skip:
+                continue
+            text = self._encode(get(name), 1, budget, prefix)
+            if budget is not None:
+                budget -= len(text) + 1
+            members[name] = text.encode('utf-8')
+        return members
+
+    def join_members(self, members: Mapping[str, bytes]) -> bytes:
+        """
+        Assemble an object from its canonical members,
+        as serialized by `dump_members`.
+        """
+        return b'{' + b','.join(members[name] for name, _
+                                in self._shape_plan(members)) + b'}'
+
+    def check_limits(self, obj: Any, skip: Optional[str] = None) -> None:
+        """
+        Check `obj`, an object or a record, against the limits
+        without serializing it, as `dump_members` would apply them.
+
+        Only a lower bound of the length of the canonical form is counted
+        (numbers as one character, strings unescaped),
+        which needs neither formatting nor sorting,
+        so oversized documents are rejected for a fraction of the cost
+        of serializing them. Documents passing the check
+        may still exceed `max_size` once serialized.
+
+        :raises CanonicalizationError: if `obj` exceeds the limits.
+        """
+        if self.max_depth is not None or self.max_size is not None:
+            self._measure(obj, skip, self.max_depth, self.max_size)
+
+    def size_hint(self, obj: Any, skip: Optional[str] = None) -> int:
+        """
+        A lower bound of the length of the canonical form of `obj`,
+        counted like `check_limits` does.
+
+        :raises CanonicalizationError: if `obj` exceeds `max_depth`,
+        or is nested more than 10000 levels deep without a `max_depth`
+        (as circular values are).
+        """
+        return self._measure(obj, skip,
+                             10000 if self.max_depth is None
+                             else self.max_depth, None)
+
+    def _measure(self, obj: Any, skip: Optional[str],
+                 max_depth: Optional[int], max_size: Optional[int]) -> int:
+        if isinstance(obj, RecordView):
+            obj = obj.record
+        if isinstance(obj, dict):
+            members = [(name, value) for name, value in obj.items()
+                       if name != skip]
+        else:
+            members = [(name, getattr(obj, name))
+                       for name, _ in _record_plan(type(obj)) or ()
+                       if name != skip]
+        size = 1 + len(members) + sum(len(name) + 3 for name, _ in members)
+        # The values still to be counted, with their depth
+        pending = [(value, 1) for _, value in members]
+        while pending:
+            value, depth = pending.pop()
+            if isinstance(value, str):
+                size += len(value) + 2
+            elif (isinstance(value, _Tracked) and
+                    value._fragment is not None):
+                text, height = value._fragment
+                size += len(text)
+                if max_depth is not None and depth + height > max_depth:
+                    raise CanonicalizationError(
+                        'Nesting deeper than {} levels'.format(max_depth))
+            elif isinstance(value, (dict, list, tuple)) or is_record(value):
+                if max_depth is not None and depth >= max_depth:
+                    raise CanonicalizationError(
+                        'Nesting deeper than {} levels'.format(max_depth))
+                if isinstance(value, dict):
+                    size += sum(len(name) + 3 for name in value)
+                    children: Iterable[Any] = value.values()
+                elif isinstance(value, (list, tuple)):
+                    children = value
+                else:
+                    plan = _record_plan(type(value))
+                    size += sum(len(prefix) for _, prefix in plan)
+                    children = [getattr(value, name) for name, _ in plan]
+                size += 1 + max(len(children), 1)
+                pending.extend((child, depth + 1) for child in children)
+            else:
+                # Numbers, literals and values the serializer rejects
+                size += 1
+            if max_size is not None and size > max_size:
+                raise CanonicalizationError(
+                    'Canonical form longer than {} characters'
+                    .format(max_size))
+        return size
+
+    def _encode(self, obj: Any, depth: int, budget: Optional[int],
+                prefix: str = '') -> str:
+        max_depth = self.max_depth
+        parts: List[str] = [prefix]
+        append = parts.append
+        size = len(prefix)
+
+        # Each frame is
+        # [items, closing bracket, is object, is first item, container,
+        #  height, index in parts, is to be cached],
+        # the items of an object being ('"name":', value) pairs
+        stack: List[List[Any]] = []
+        # Ids of the containers being serialized, to detect cycles
+        markers = set()
+        value = obj
+        while True:
+            if isinstance(value, str):
+                text = encode_basestring(value)
+            elif value is None:
+                text = 'null'
+            elif value is True:
+                text = 'true'
+            elif value is False:
+                text = 'false'
+            elif isinstance(value, int):
+                text = (int.__repr__(value)
+                        if -_MAX_EXACT_INT < value < _MAX_EXACT_INT
+                        else _es6_number(value))
+            elif isinstance(value, float):
+                text = _es6_number(value)
+            elif (isinstance(value, _Tracked) and
+                    value._fragment is not None):
+                text, height = value._fragment
+                if (max_depth is not None and
+                        depth + len(stack) + height > max_depth):
+                    raise CanonicalizationError(
+                        'Nesting deeper than {} levels'.format(max_depth))
+                if stack and stack[-1][5] <= height:
+                    stack[-1][5] = height + 1
+            else:
+                if isinstance(value, dict):
+                    frame = [_object_items(value, self._shape_plan(value)),
+                             '}', True, True]
+                    text = '{'
+                elif isinstance(value, (list, tuple)):
+                    frame = [iter(value), ']', False, True]
+                    text = '['
+                else:
+                    plan = _record_plan(type(value))
+                    if plan is None or isinstance(value, type):
+                        raise TypeError(
+                            "Object of type '{}' is not JSON serializable"
+                            .format(type(value).__name__))
+                    frame = [_record_items(value, plan), '}', True, True]
+                    text = '{'
+                if max_depth is not None and depth + len(stack) >= max_depth:
+                    raise CanonicalizationError(
+                        'Nesting deeper than {} levels'.format(max_depth))
+                if id(value) in markers:
+                    raise ValueError('Circular reference detected')
+                markers.add(id(value))
+                frame += [value, 1, len(parts), isinstance(value, _Tracked)]
+                stack.append(frame)
+            append(text)
+            size += len(text)
+            if budget is not None and size > budget:
+                raise CanonicalizationError(
+                    'Canonical form longer than {} characters'
+                    .format(self.max_size))
+
+            # Find the next value, closing finished containers
+            while stack:
+                frame = stack[-1]
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    markers.discard(id(frame[4]))
+                    append(frame[1])
+                    size += 1
+                    if frame[7]:
+                        text = ''.join(parts[frame[6]:])
+                        del parts[frame[6]:]
+                        append(text)
+                        frame[4]._fragment = text, frame[5]
+                    if stack:
+                        parent = stack[-1]
+                        if parent[5] <= frame[5]:
+                            parent[5] = frame[5] + 1
+                        if not frame[7]:
+                            parent[7] = False
+                    continue
+                if frame[3]:
+                    frame[3] = False
+                else:
+                    append(',')
+                    size += 1
+                if frame[2]:
+                    key, value = item
+                    append(key)
+                    size += len(key)
+                else:
+                    value = item
+                break
+            else:
+                if budget is not None and size > budget:
+                    raise CanonicalizationError(
+                        'Canonical form longer than {} characters'
+                        .format(self.max_size))
+                return ''.join(parts)
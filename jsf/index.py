@@ -0,0 +1,209 @@
+"""
+An index of who signed what, for re-verifying the documents
+of a revoked or rotated key without re-verifying all the others.
+
+`SignerIndex` records, for each signer of each verified document,
+the document id, the key id and public key thumbprint (RFC 7638),
+the algorithm and the verdict, in an SQLite database indexed
+by key id and thumbprint.
+`SignerIndex.revalidate` re-verifies the documents of a given key.
+
+From the command line, over a `jsf.archive` archive,
+document ids being entry numbers:
+
+    python -m jsf index ARCHIVE
+    python -m jsf revalidate ARCHIVE --key=KEY [--revoked]
+"""
+
+import sqlite3
+from time import time
+from typing import (
+    TYPE_CHECKING, Callable, Collection, Iterator, List, Mapping, NamedTuple,
+    Optional, Tuple)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, _KEYID, _PUBLICKEY, _SIGNERS)
+from .archive import signer_metadata
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS signatures (
+    document TEXT NOT NULL,
+    signer INTEGER NOT NULL,
+    property TEXT NOT NULL,
+    mode TEXT,
+    key_id TEXT,
+    thumbprint TEXT,
+    algorithm TEXT,
+    valid INTEGER,
+    checked REAL NOT NULL,
+    PRIMARY KEY (document, signer)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS signatures_key_id ON signatures (key_id);
+CREATE INDEX IF NOT EXISTS signatures_thumbprint ON signatures (thumbprint);
+'''
+
+
+class Signature(NamedTuple):
+    """
+    A signer of a document, as indexed.
+    """
+    document: str
+    signer: int
+    property: str
+    mode: Optional[str]
+    """`"single"`, `"multiple"` or `"chain"`."""
+    key_id: Optional[str]
+    thumbprint: Optional[str]
+    algorithm: Optional[AlgorithmName]
+    valid: Optional[bool]
+    """The verdict of the signer, if known."""
+    checked: float
+    """When the verdict was recorded, as a Unix time."""
+
+
+def _valid(mode: Optional[str], verdicts: List[Optional[bool]]) -> bool:
+    # A multiple signature is valid if any signature is valid,
+    # the others if all are
+    if not verdicts:
+        return False
+    if mode == 'multiple':
+        return any(verdicts)
+    return all(verdicts)
+
+
+def _verification_key(document: JsonObject, prop: str,
+                      keys: Optional[Mapping[str, 'JWK']]
+                      ) -> Optional['JWK']:
+    # The key of a single signature without an embedded key
+    h = document.get(prop)
+    if (keys and isinstance(h, dict) and _SIGNERS not in h and
+            _PUBLICKEY not in h):
+        return keys.get(h.get(_KEYID))
+    return None
+
+
+class SignerIndex:
+    """
+    The signer index in the SQLite database at `path`.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._db = sqlite3.connect(path)
+        # Each record is a transaction; without a sync per transaction,
+        # a crash loses at most the last ones, which verifying again restores
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        self._db.executescript(_SCHEMA)
+
+    def record(self, jsf: JSF, prop: str, document: str,
+               key: Optional['JWK'] = None) -> None:
+        """
+        Record the signers of `jsf` after `jsf.verify(prop, key)`,
+        successful or not, replacing those recorded for `document`.
+        """
+        metadata = signer_metadata(jsf._doc, prop)
+        thumbprint = key.thumbprint() if key is not None else None
+        # Signers past the entries kept by the report have no verdict
+        verdicts = {r.index: r.ok for r in jsf.report.entries}
+        checked = time()
+        with self._db:
+            self._db.execute('DELETE FROM signatures WHERE document = ?',
+                             (document,))
+            self._db.executemany(
+                'INSERT INTO signatures VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(document, i, prop, metadata['mode'],
+                  s['keyId'] if s['keyId'] is not None or key is None
+                  else key.get('kid'),
+                  thumbprint or s['thumbprint'], s['algorithm'],
+                  verdicts.get(i), checked)
+                 for i, s in enumerate(metadata['signers'])])
+
+    def verify(self, jsf: JSF, prop: str, document: str,
+               key: Optional['JWK'] = None,
+               alg: Optional[AlgorithmName] = None) -> None:
+        """
+        `jsf.verify(prop, key, alg)`, recording the signers of `document`
+        whatever the outcome.
+        """
+        try:
+            jsf.verify(prop, key, alg)
+        finally:
+            self.record(jsf, prop, document, key)
+
+    def signatures(self, key: Optional[str] = None,
+                   document: Optional[str] = None) -> Iterator[Signature]:
+        """
+        The indexed signers, of the key with the key id or thumbprint
+        `key`, or of `document`, if given.
+        """
+        query = 'SELECT * FROM signatures'
+        params: Tuple[str, ...] = ()
+        if key is not None:
+            query += ' WHERE (key_id = ? OR thumbprint = ?)'
+            params = key, key
+        if document is not None:
+            query += ' AND' if params else ' WHERE'
+            query += ' document = ?'
+            params += document,
+        for row in self._db.execute(query + ' ORDER BY document, signer',
+                                    params):
+            yield Signature(*row[:7], None if row[7] is None
+                            else bool(row[7]), row[8])
+
+    def documents(self, key: str) -> List[str]:
+        """
+        The ids of the documents signed by the key with the key id
+        or thumbprint `key`.
+        """
+        return [row[0] for row in self._db.execute(
+            'SELECT DISTINCT document FROM signatures '
+            'WHERE key_id = ? OR thumbprint = ? ORDER BY document',
+            (key, key))]
+
+    def revalidate(self, key: str, load: Callable[[str], JsonObject],
+                   keys: Optional[Mapping[str, 'JWK']] = None,
+                   revoked: Collection[str] = (),
+                   jsf_class: Callable[[JsonObject], JSF] = JSF
+                   ) -> Iterator[Tuple[str, bool]]:
+        """
+        Re-verify the documents signed by the key with the key id
+        or thumbprint `key`, recording the new verdicts.
+
+        :param load: Load a document, by id.
+
+        :param keys: Public keys, by key id, for the signatures
+        without an embedded one.
+
+        :param revoked: Key ids or thumbprints of revoked keys:
+        their signatures are failures, however they verify.
+
+        :returns: The id of each document and whether it is still valid.
+        """
+        from jwcrypto.jws import InvalidJWSSignature
+        for document in self.documents(key):
+            prop = next(self.signatures(document=document)).property
+            jsf = jsf_class(load(document))
+            try:
+                self.verify(jsf, prop, document,
+                            _verification_key(jsf._doc, prop, keys))
+            except InvalidJWSSignature:
+                pass
+            signatures = list(self.signatures(document=document))
+            yield document, _valid(
+                signatures[0].mode if signatures else None,
+                [bool(s.valid) and s.key_id not in revoked and
+                 s.thumbprint not in revoked for s in signatures])
+
+    def close(self) -> None:
+        self._db.close()
+
+    def __enter__(self) -> 'SignerIndex':
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
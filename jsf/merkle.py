@@ -0,0 +1,221 @@
+"""
+Batch signing: one signature over the Merkle tree of many payloads.
+
+`sign_batch` canonicalizes each payload with its signature object,
+hashes them into the leaves of a Merkle tree and signs the root once.
+Each payload then gets a single signature object carrying the signature
+of the root and, in the `merkleProof` extension, the inclusion proof
+of its leaf:
+
+    "signature": {
+      "algorithm": "ES256",
+      "publicKey": {...},
+      "extensions": ["merkleProof"],
+      "merkleProof": {"index": 2, "count": 5, "path": ["...", "..."]},
+      "value": "..."
+    }
+
+The leaf of a payload is the hash of its canonical form, with
+the signature object minus `value` and `merkleProof`, as JSF signs it;
+the tree hashes leaves and nodes with distinct prefixes (RFC 6962).
+An odd node at the end of a level is carried up unchanged.
+The hash function is that of the algorithm (SHA-256 for EdDSA).
+
+`MerkleJSF` verifies such signatures, and any other JSF signature;
+`JSF` rejects the extension as unknown.
+Verified roots are remembered, so verifying the payloads of a batch
+costs one signature verification and a few hashes each.
+"""
+
+from collections import OrderedDict
+from copy import copy
+from hashlib import new
+import json
+from threading import Lock
+from typing import (
+    TYPE_CHECKING, Iterable, Iterator, List, Optional, Sequence, Tuple)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, _EXTENSIONS, _PUBLICKEY, _VALUE,
+    _Members, _PatchHeader, _hash_name, _prevalidation_failed)
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+MERKLE_PROOF = 'merkleProof'
+
+_INDEX = 'index'
+_COUNT = 'count'
+_PATH = 'path'
+
+# Bounds a proof, whatever the size of the batch
+_MAX_PATH = 64
+
+
+def _leaf(hash_name: str, canonical: bytes) -> bytes:
+    return new(hash_name, b'\0' + canonical).digest()
+
+
+def _node(hash_name: str, left: bytes, right: bytes) -> bytes:
+    return new(hash_name, b'\1' + left + right).digest()
+
+
+def _levels(hash_name: str, leaves: List[bytes]) -> List[List[bytes]]:
+    # The levels of the tree, from the leaves to the root
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        levels.append([_node(hash_name, level[i], level[i + 1])
+                       if i + 1 < len(level) else level[i]
+                       for i in range(0, len(level), 2)])
+    return levels
+
+
+def _path(levels: List[List[bytes]], index: int) -> Iterator[bytes]:
+    for level in levels[:-1]:
+        if index ^ 1 < len(level):
+            yield level[index ^ 1]
+        index //= 2
+
+
+def merkle_root(hash_name: str, leaf: bytes, index: int, count: int,
+                path: Iterable[bytes]) -> bytes:
+    """
+    The root of the tree of `count` leaves whose leaf `index` is `leaf`,
+    as proven by `path`.
+
+    :raises ValueError: if `path` has not the length `count` implies.
+    """
+    nodes = iter(path)
+    node = leaf
+    try:
+        while count > 1:
+            if index % 2:
+                node = _node(hash_name, next(nodes), node)
+            elif index + 1 < count:
+                node = _node(hash_name, node, next(nodes))
+            index //= 2
+            count = (count + 1) // 2
+    except StopIteration:
+        raise ValueError('Merkle proof too short')
+    if next(nodes, None) is not None:
+        raise ValueError('Merkle proof too long')
+    return node
+
+
+class MerkleJSF(JSF):
+    """
+    A `JSF` verifying single signatures over Merkle roots,
+    as created by `sign_batch`, as well as plain ones.
+    """
+
+    supported_extensions = frozenset({MERKLE_PROOF})
+
+    max_verified_roots = 1024
+    """The number of verified roots remembered."""
+
+    # (algorithm, key, root, signature) of the verified roots
+    _verified_roots: 'OrderedDict[Tuple[str, str, bytes, bytes], None]' = (
+        OrderedDict())
+    _verified_roots_lock = Lock()
+
+    def _prevalidate(self, key: Optional['JWK'],
+                     alg: Optional[AlgorithmName], header: JsonObject,
+                     signer: Optional[JsonObject]) -> None:
+        super()._prevalidate(key, alg, header, signer)
+        if MERKLE_PROOF not in header.get(_EXTENSIONS, []):
+            return
+        rejected = _prevalidation_failed()
+        if signer is not None:
+            raise rejected('extension',
+                           'Merkle proofs only apply to single signatures')
+        proof = header.get(MERKLE_PROOF)
+        if not (isinstance(proof, dict) and
+                type(proof.get(_INDEX)) is int and
+                type(proof.get(_COUNT)) is int and
+                0 <= proof[_INDEX] < proof[_COUNT] and
+                isinstance(proof.get(_PATH), list) and
+                len(proof[_PATH]) <= _MAX_PATH and
+                all(isinstance(node, str) for node in proof[_PATH])):
+            raise rejected('extension', 'Invalid Merkle proof')
+
+    def _verify(self, prop: str, key: 'JWK', alg: Optional[AlgorithmName],
+                header: JsonObject, signer: Optional[JsonObject],
+                patch_header: _PatchHeader, members: _Members) -> None:
+        if signer is not None or MERKLE_PROOF not in header.get(
+                _EXTENSIONS, []):
+            return super()._verify(prop, key, alg, header, signer,
+                                   patch_header, members)
+
+        from jwcrypto.common import base64url_decode
+        from jwcrypto.jwk import JWK
+        from jwcrypto.jws import InvalidJWSSignature, JWSCore
+
+        a = self._get_alg(alg, header, InvalidJWSSignature)
+        hash_name = _hash_name(a)
+
+        payload = copy(members)
+        h = copy(header)
+        signature = base64url_decode(h.pop(_VALUE))
+        proof = h.pop(MERKLE_PROOF)
+        payload[prop] = self.canonicalizer.dump_member(prop, h)
+        canonical = self.canonicalizer.join_members(payload)
+        root = merkle_root(hash_name, _leaf(hash_name, canonical),
+                           proof[_INDEX], proof[_COUNT],
+                           map(base64url_decode, proof[_PATH]))
+
+        verified = (a, json.dumps(key if key is not None
+                                  else h.get(_PUBLICKEY), sort_keys=True),
+                    root, signature)
+        with self._verified_roots_lock:
+            known = verified in self._verified_roots
+            if known:
+                self._verified_roots.move_to_end(verified)
+        if not known:
+            if key is None:
+                key = JWK(**h.get(_PUBLICKEY, None))
+            c = JWSCore(a, key, header=None, payload='',
+                        algs=self._allowed_algs)
+            c.engine.verify(key, root, signature)
+            with self._verified_roots_lock:
+                self._verified_roots[verified] = None
+                while len(self._verified_roots) > self.max_verified_roots:
+                    self._verified_roots.popitem(last=False)
+        self._signed = a, canonical
+
+
+def sign_batch(payloads: Sequence[JsonObject], prop: str, key: 'JWK',
+               alg: Optional[AlgorithmName] = None,
+               header: Optional[JsonObject] = None) -> List[MerkleJSF]:
+    """
+    Sign each of `payloads` with a single `key`, like
+    `add_single_signature`, with one signature over their Merkle tree.
+
+    :returns: A signed `MerkleJSF` per payload,
+    whose payloads are those given, updated in place.
+    """
+    from jwcrypto.common import base64url_encode
+    from jwcrypto.jws import JWSCore
+
+    h = dict(header or {})
+    h[_EXTENSIONS] = [e for e in h.get(_EXTENSIONS, [])
+                      if e != MERKLE_PROOF] + [MERKLE_PROOF]
+    jsfs = [MerkleJSF(payload) for payload in payloads]
+    requests = [jsf._prepare_signature(prop, alg, h, *jsf._single(prop))
+                for jsf in jsfs]
+    if not requests:
+        return []
+
+    a = requests[0].algorithm
+    hash_name = _hash_name(a)
+    levels = _levels(hash_name, [_leaf(hash_name, request.canonical)
+                                 for request in requests])
+    c = JWSCore(a, key, header=None, payload='', algs=jsfs[0].allowed_algs)
+    signature = c.engine.sign(key, levels[-1][0])
+    for i, (jsf, request) in enumerate(zip(jsfs, requests)):
+        request.header[MERKLE_PROOF] = {
+            _INDEX: i, _COUNT: len(requests),
+            _PATH: [base64url_encode(node) for node in _path(levels, i)]}
+        jsf._install_signature(request, signature)
+    return jsfs
@@ -0,0 +1,197 @@
+"""
+Verification policies for documents already verified upstream,
+such as on internal hops behind a verifying edge.
+
+A `VerificationPolicy` verifies some documents and trusts the others:
+documents signed by an allow-listed key or from an allow-listed issuer
+are always verified, one in `sample` of the others is verified,
+and the rest are either skipped or verified in a background thread,
+which reports failures through a callback.
+The path taken is recorded in `JSF.verification_path`;
+the payload of a skipped or deferred document is available
+as if it had been verified.
+"""
+
+from copy import deepcopy
+from queue import Full, Queue
+from random import Random
+from threading import Lock, Thread
+from typing import (
+    TYPE_CHECKING, Any, Callable, Collection, Iterator, Optional, Tuple)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, VerificationPath, VerificationReport,
+    _CHAIN, _KEYID, _PUBLICKEY, _SIGNERS)
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+FailureCallback = Callable[[JsonObject, VerificationReport], None]
+"""
+Called with the payload and the report of a deferred verification
+that failed.
+"""
+
+
+class VerificationPolicy:
+    """
+    Decide, document by document, whether to verify,
+    and apply the decision.
+
+    :param sample: Verify one in `sample` documents, at random;
+    1 verifies them all, 0 only the allow-listed ones.
+
+    :param keys: Always verify documents with a signer having one of
+    these key ids (`keyId`) or public key thumbprints (RFC 7638).
+
+    :param issuers: Always verify documents whose `issuer_property`
+    has one of these values.
+
+    :param defer: Verify the documents not verified right away
+    in a background thread, instead of skipping them.
+
+    :param on_failure: Called from the background thread
+    for each deferred document that fails verification;
+    it must not raise.
+
+    :param queue_size: The number of deferred documents waiting at most;
+    beyond that, documents are verified right away.
+    """
+
+    def __init__(self, sample: int = 1, keys: Collection[str] = (),
+                 issuers: Collection[Any] = (),
+                 issuer_property: str = 'issuer', defer: bool = False,
+                 on_failure: Optional[FailureCallback] = None,
+                 queue_size: int = 1000,
+                 random: Optional[Random] = None) -> None:
+        if sample < 0:
+            raise ValueError('sample must not be negative')
+        self.sample = sample
+        self.keys = frozenset(keys)
+        self.issuers = frozenset(issuers)
+        self.issuer_property = issuer_property
+        self.defer = defer
+        self.on_failure = on_failure
+        self._random = random or Random()
+        self._queue: 'Queue[Optional[Tuple[Any, ...]]]' = Queue(queue_size)
+        self._thread: Optional[Thread] = None
+        self._lock = Lock()
+        self.verified = 0
+        self.skipped = 0
+        self.deferred = 0
+        self.failed = 0
+        """
+        The counts of documents verified right away, skipped and deferred,
+        and of deferred documents that failed verification.
+        """
+
+    def _signers(self, h: JsonObject) -> Iterator[JsonObject]:
+        signers = h.get(_SIGNERS) or h.get(_CHAIN) or [h]
+        for signer in signers if isinstance(signers, list) else [h]:
+            if isinstance(signer, dict):
+                yield signer
+
+    def _allow_listed(self, jsf: JSF, prop: str) -> bool:
+        doc = jsf._doc
+        if self.issuers and doc.get(self.issuer_property) in self.issuers:
+            return True
+        h = doc.get(prop)
+        if not self.keys or not isinstance(h, dict):
+            return False
+        for signer in self._signers(h):
+            if signer.get(_KEYID, h.get(_KEYID)) in self.keys:
+                return True
+            public_key = signer.get(_PUBLICKEY, h.get(_PUBLICKEY))
+            if isinstance(public_key, dict):
+                from jwcrypto.jwk import JWK
+                try:
+                    if JWK(**public_key).thumbprint() in self.keys:
+                        return True
+                except Exception:
+                    # Left to the verification
+                    return True
+        return False
+
+    def verify(self, jsf: JSF, prop: str, key: Optional['JWK'] = None,
+               alg: Optional[AlgorithmName] = None) -> VerificationPath:
+        """
+        Verify `jsf` like `JSF.verify`, or skip or defer it,
+        as the policy decides.
+
+        :returns: The path taken, also set as `jsf.verification_path`.
+
+        :raises VerificationFailed: as `JSF.verify`,
+        if verified right away.
+        """
+        if (self.sample == 1 or
+                (self.sample and self._random.randrange(self.sample) == 0)
+                or self._allow_listed(jsf, prop)):
+            return self._verify_now(jsf, prop, key, alg)
+        if not self.defer:
+            jsf.verification_path = VerificationPath.SKIPPED
+            with self._lock:
+                self.skipped += 1
+            return jsf.verification_path
+
+        # The payload may change once handed back
+        job = (type(jsf), deepcopy(jsf._payload), prop, key, alg,
+               jsf.allowed_algs)
+        self._start()
+        try:
+            self._queue.put_nowait(job)
+        except Full:
+            return self._verify_now(jsf, prop, key, alg)
+        jsf.verification_path = VerificationPath.DEFERRED
+        with self._lock:
+            self.deferred += 1
+        return jsf.verification_path
+
+    def _verify_now(self, jsf: JSF, prop: str, key: Optional['JWK'],
+                    alg: Optional[AlgorithmName]) -> VerificationPath:
+        with self._lock:
+            self.verified += 1
+        jsf.verify(prop, key, alg)
+        return VerificationPath.VERIFIED
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True,
+                                      name='jsf-deferred-verification')
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                cls, payload, prop, key, alg, allowed_algs = job
+                jsf = cls(payload)
+                jsf.allowed_algs = allowed_algs
+                try:
+                    jsf.verify(prop, key, alg)
+                except Exception:
+                    with self._lock:
+                        self.failed += 1
+                    if self.on_failure is not None:
+                        self.on_failure(payload, jsf.report)
+            finally:
+                self._queue.task_done()
+
+    def join(self) -> None:
+        """
+        Wait until the deferred documents are verified.
+        """
+        self._queue.join()
+
+    def close(self) -> None:
+        """
+        Verify the deferred documents and stop the background thread.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
@@ -0,0 +1,210 @@
+"""
+Cost estimates and deadline-aware ordering of verifications.
+
+Verification costs vary by orders of magnitude between documents:
+an HMAC is almost free next to a P-521 signature, a long chain
+verifies one signature per link, and canonicalization grows with
+the payload. `CostModel` estimates the cost of verifying a document
+from its signature objects and payload size, without verifying it.
+
+`plan` orders work by deadline and sheds what cannot make its deadline,
+dropping the most expensive items first so that one slow item does not
+make several cheap ones late. Items without a deadline come last,
+cheapest first.
+"""
+
+from heapq import heappop, heappush
+from time import monotonic
+from typing import (
+    TYPE_CHECKING, Any, Callable, List, Mapping, Optional, Sequence, Tuple)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, _ALGORITHM, _CHAIN, _PUBLICKEY, _SIGNERS,
+    _rsa_key_size)
+from .canonical import Canonicalizer, CanonicalizationError
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+class CostModel:
+    """
+    Estimates of the time `JSF.verify` takes on a document.
+
+    Estimates are nominal: seconds on one core of a current x86-64
+    machine, which the default costs are rough figures for.
+    Multiply them by `scale`, which `observe` fits to the actual machine,
+    for seconds on this one.
+    """
+
+    algorithm_costs = {
+        'HS256': 5e-6, 'HS384': 5e-6, 'HS512': 5e-6,
+        'ES256': 140e-6, 'ES256K': 750e-6, 'ES384': 900e-6,
+        'ES512': 1.1e-3, 'EdDSA': 200e-6, 'Ed25519': 200e-6,
+        'Ed448': 400e-6,
+    }
+    """The cost of checking one signature, by algorithm."""
+
+    rsa_cost = 60e-6
+    """
+    The cost of checking one RSA signature with a 2048-bit key;
+    it grows with the square of the key size.
+    """
+
+    unknown_cost = 1e-3
+    """The cost of checking a signature of any other algorithm."""
+
+    document_cost = 60e-6
+    signer_cost = 20e-6
+    byte_cost = 150e-9
+    """
+    The costs of verifying any document, of preparing each signer,
+    and of canonicalizing each byte of the document.
+    """
+
+    def __init__(self, canonicalizer: Optional[Canonicalizer] = None,
+                 smoothing: float = 0.1) -> None:
+        self.canonicalizer = (canonicalizer if canonicalizer is not None
+                              else JSF.canonicalizer)
+        self.smoothing = smoothing
+        self.scale = 1.0
+
+    def algorithm_cost(self, alg: Optional[AlgorithmName],
+                       key: Optional[Mapping[str, Any]] = None) -> float:
+        """
+        The cost of checking one signature of `alg` with `key`,
+        if known.
+        """
+        if not isinstance(alg, str):
+            return self.unknown_cost
+        if alg[:2] in ('RS', 'PS'):
+            size = 2048
+            if key is not None and key.get('kty') == 'RSA':
+                try:
+                    size = _rsa_key_size(key)
+                except Exception:
+                    pass
+            return self.rsa_cost * (size / 2048) ** 2
+        if alg == 'EdDSA' and key is not None and isinstance(
+                key.get('crv'), str):
+            alg = key['crv']
+        return self.algorithm_costs.get(alg, self.unknown_cost)
+
+    def estimate(self, document: JsonObject, prop: str,
+                 key: Optional['JWK'] = None,
+                 alg: Optional[AlgorithmName] = None,
+                 size: Optional[int] = None) -> float:
+        """
+        Estimate the time verifying `document` takes, nominally.
+
+        :param size: The size of the document, if known,
+        for instance from its JSON text;
+        by default a lower bound is counted.
+
+        Unverified documents are estimated as they are:
+        what cannot be made sense of counts as `unknown_cost`.
+        """
+        if not isinstance(prop, str):
+            return self.unknown_cost
+        h = document.get(prop)
+        if not isinstance(h, dict):
+            return self.document_cost
+        if size is None:
+            try:
+                size = self.canonicalizer.size_hint(document)
+            except (CanonicalizationError, TypeError, ValueError):
+                size = 0
+        cost = self.document_cost + size * self.byte_cost
+        chain = _CHAIN in h
+        signers = h.get(_SIGNERS) or h.get(_CHAIN) or [h]
+        if not isinstance(signers, list):
+            signers = [h]
+        for i, signer in enumerate(signers):
+            s = signer if isinstance(signer, dict) else {}
+            public_key = key if key is not None else s.get(
+                _PUBLICKEY, h.get(_PUBLICKEY))
+            cost += self.algorithm_cost(
+                alg or s.get(_ALGORITHM, h.get(_ALGORITHM)),
+                public_key if isinstance(public_key, Mapping) else None)
+            # Each link of a chain signs the links before it
+            cost += self.signer_cost * (i + 1 if chain else 1)
+        return cost
+
+    def observe(self, estimate: float, elapsed: float) -> None:
+        """
+        Record the actual time, in seconds, of a verification
+        estimated to take `estimate`, to fit `scale`.
+        """
+        if estimate > 0:
+            self.scale += self.smoothing * (elapsed / estimate - self.scale)
+
+
+default_model = CostModel()
+"""
+The cost model shared by default,
+so that its scale follows the machine across calls.
+"""
+
+
+def plan(costs: Sequence[float], deadlines: Sequence[Optional[float]],
+         now: Optional[float] = None) -> Tuple[List[int], List[int]]:
+    """
+    Order items by deadline, dropping those that would make
+    the most items late (Moore and Hodgson's algorithm).
+    Items without a deadline come last, cheapest first.
+
+    :param costs: The cost of each item, in seconds.
+
+    :param deadlines: The deadline of each item, on the `monotonic` clock,
+    or None.
+
+    :returns: The indices of the items in the order to process them,
+    and the indices of the dropped items.
+    """
+    if now is None:
+        now = monotonic()
+    timed = sorted((i for i, d in enumerate(deadlines) if d is not None),
+                   key=lambda i: (deadlines[i], costs[i]))
+    untimed = sorted((i for i, d in enumerate(deadlines) if d is None),
+                     key=costs.__getitem__)
+    # The kept items, the most expensive on top
+    kept: List[Tuple[float, int]] = []
+    dropped = []
+    t = now
+    for i in timed:
+        heappush(kept, (-costs[i], i))
+        t += costs[i]
+        if t > deadlines[i]:
+            cost, j = heappop(kept)
+            t += cost
+            dropped.append(j)
+    order = sorted((i for _, i in kept),
+                   key=lambda i: (deadlines[i], costs[i]))
+    return order + untimed, sorted(dropped)
+
+
+def run_planned(order: Sequence[int], costs: Sequence[float],
+                deadlines: Sequence[Optional[float]],
+                run: Callable[[int], None],
+                model: Optional[CostModel] = None) -> List[int]:
+    """
+    Run the items in `order`, skipping those that can no longer
+    make their deadline, and feeding the actual times to `model`.
+
+    :param costs: The cost of each item, as estimated by `model`,
+    else in seconds.
+
+    :returns: The indices of the skipped items.
+    """
+    skipped = []
+    for i in order:
+        deadline = deadlines[i]
+        start = monotonic()
+        scale = model.scale if model is not None else 1.0
+        if deadline is not None and start + costs[i] * scale > deadline:
+            skipped.append(i)
+            continue
+        run(i)
+        if model is not None:
+            model.observe(costs[i], monotonic() - start)
+    return skipped
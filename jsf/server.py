@@ -0,0 +1,456 @@
+"""
+A local HTTP service signing and verifying JSF documents,
+for applications that do not embed this module.
+
+Requests are JSON objects POSTed to `/verify` or `/sign`;
+`/metrics` reports request counts, batch sizes, latencies and throughput.
+
+Concurrent requests are queued and handed to a pool of worker threads
+in batches of up to `max_batch`, gathered for at most `max_delay` seconds.
+The queue is bounded: when it is full,
+requests are answered at once with status 503, so that clients back off
+instead of piling up work the service cannot keep up with.
+
+Requests may set a `"timeout"`, in seconds. Queued requests are served
+earliest deadline first, then cheapest first (see `jsf.schedule`);
+those that can no longer be answered in time are skipped
+and answered with status 504.
+"""
+
+import asyncio
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+import json
+from threading import Lock
+from time import monotonic, perf_counter
+from typing import (
+    TYPE_CHECKING, Any, Callable, Deque, Dict, Iterable, List, Mapping,
+    Optional, Tuple)
+
+from . import JSF, JsonObject, _KEYID, _PUBLICKEY
+from .schedule import CostModel, default_model
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+_REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+    405: 'Method Not Allowed', 413: 'Payload Too Large',
+    503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+_Response = Tuple[int, JsonObject]
+_Handler = Callable[[JsonObject], _Response]
+# A queued request: its deadline, estimated cost and arrival order
+# (to order the queue), and the future of its response
+_Job = Tuple[float, float, int, _Handler, JsonObject,
+             'asyncio.Future[_Response]']
+
+
+class KeyCache:
+    """
+    The keys of a service: the configured ones, by key id,
+    and the public keys found in documents, parsed once.
+
+    :param keys: The configured keys; each needs a `kid`.
+
+    :param maxsize: The maximum number of document keys to keep;
+    the least recently used one is evicted first.
+    """
+
+    def __init__(self, keys: Iterable['JWK'] = (),
+                 maxsize: int = 1024) -> None:
+        self.keys = {}
+        for key in keys:
+            if not isinstance(key.get('kid'), str):
+                raise ValueError('Key without a key id ("kid")')
+            self.keys[key['kid']] = key
+        self.maxsize = maxsize
+        self._public: 'OrderedDict[str, JWK]' = OrderedDict()
+        self._lock = Lock()
+
+    @classmethod
+    def load(cls, path: str, maxsize: int = 1024) -> 'KeyCache':
+        """
+        Load the keys of a JWK Set file. Each key needs a `kid`.
+        """
+        from jwcrypto.jwk import JWK
+        with open(path, encoding='utf-8') as f:
+            keys = json.load(f)['keys']
+        return cls((JWK(**key) for key in keys), maxsize)
+
+    def get(self, key_id: str) -> Optional['JWK']:
+        return self.keys.get(key_id)
+
+    def public(self, key: Mapping[str, Any]) -> 'JWK':
+        """
+        The parsed form of a public key found in a document.
+        """
+        from jwcrypto.jwk import JWK
+        name = json.dumps(key, sort_keys=True)
+        with self._lock:
+            jwk = self._public.get(name)
+            if jwk is not None:
+                self._public.move_to_end(name)
+                return jwk
+        jwk = JWK(**key)
+        with self._lock:
+            self._public[name] = jwk
+            if len(self._public) > self.maxsize:
+                self._public.popitem(last=False)
+        return jwk
+
+
+class Metrics:
+    """
+    Counters of a service, and the latencies of its recent requests.
+
+    :param endpoints: The endpoints counted on their own;
+    requests to any other path are counted as `"other"`.
+
+    :param window: The number of latencies kept per endpoint.
+    """
+
+    def __init__(self, endpoints: Iterable[str] = (),
+                 window: int = 1024) -> None:
+        self.started = monotonic()
+        self.endpoints = frozenset(endpoints)
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.rejected = 0
+        self.skipped = 0
+        self.batches = 0
+        self.batched = 0
+        self._window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+
+    def add(self, endpoint: str, status: int, latency: float) -> None:
+        # Paths are chosen by clients: only known ones get their own entries
+        if endpoint not in self.endpoints:
+            endpoint = 'other'
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        if status != 200:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+        self._latencies.setdefault(
+            endpoint, deque(maxlen=self._window)).append(latency)
+
+    def add_batch(self, size: int) -> None:
+        self.batches += 1
+        self.batched += size
+
+    def snapshot(self, queued: int = 0) -> JsonObject:
+        uptime = monotonic() - self.started
+        latencies = {}
+        for endpoint, window in self._latencies.items():
+            ordered = sorted(window)
+            latencies[endpoint] = {
+                'p50': ordered[len(ordered) // 2],
+                'p99': ordered[min(len(ordered) - 1,
+                                   len(ordered) * 99 // 100)],
+                'max': ordered[-1],
+            }
+        return {
+            'uptime': uptime,
+            'requests': dict(self.requests),
+            'errors': dict(self.errors),
+            'rejected': self.rejected,
+            'skipped': self.skipped,
+            'throughput': sum(self.requests.values()) / uptime,
+            'batches': self.batches,
+            'meanBatchSize': self.batched / self.batches if self.batches
+                             else 0.0,
+            'queued': queued,
+            'latency': latencies,
+        }
+
+
+class VerificationService:
+    """
+    The request handling of the service, independent of HTTP.
+
+    :param workers: The number of worker threads,
+    and thus of batches in flight.
+
+    :param max_batch: The maximum number of requests per batch.
+
+    :param max_delay: How long a batch waits for more requests
+    after the first one, in seconds.
+
+    :param queue_size: The maximum number of requests waiting
+    for a worker.
+
+    :param timeout: The timeout of requests not setting one, if any.
+
+    :param model: The cost model to order requests with,
+    by default `jsf.schedule.default_model`.
+    """
+
+    def __init__(self, keys: Optional[KeyCache] = None, workers: int = 4,
+                 max_batch: int = 32, max_delay: float = 0.002,
+                 queue_size: int = 1024, timeout: Optional[float] = None,
+                 model: Optional[CostModel] = None) -> None:
+        self.keys = keys if keys is not None else KeyCache()
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.model = model if model is not None else default_model
+        self._handlers: Dict[str, _Handler] = {
+            '/verify': self.verify, '/sign': self.sign}
+        self.metrics = Metrics(['/metrics', *self._handlers])
+        self._arrivals = count()
+        self._queue: Optional['asyncio.PriorityQueue[_Job]'] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._dispatcher: Optional['asyncio.Task[None]'] = None
+
+    def verify(self, request: JsonObject) -> _Response:
+        """
+        Verify `request["document"]`, whose signatures are in
+        `request["property"]` (by default `"signature"`),
+        with the key `request["keyId"]` if specified,
+        else with the configured key matching the key id of the signature,
+        else with the key of the signature object.
+        """
+        document = request['document']
+        prop = request.get('property', 'signature')
+        key = None
+        if 'keyId' in request:
+            key = self.keys.get(request['keyId'])
+            if key is None:
+                return 400, {'error': 'Unknown key id'}
+        else:
+            signature = document.get(prop)
+            if isinstance(signature, dict):
+                key_id = signature.get(_KEYID)
+                if isinstance(key_id, str):
+                    key = self.keys.get(key_id)
+                if key is None and isinstance(signature.get(_PUBLICKEY),
+                                              dict):
+                    key = self.keys.public(signature[_PUBLICKEY])
+        jsf = JSF(document)
+        error = None
+        try:
+            jsf.verify(prop, key=key, alg=request.get('algorithm'))
+        except Exception as e:
+            error = str(e)
+        return 200, {
+            'valid': error is None,
+            'error': error,
+            'results': [{'index': r.index, 'ok': r.ok, 'keyId': r.key_id,
+                         'error': None if r.ok else repr(r)}
+                        for r in jsf.report.entries],
+        }
+
+    def sign(self, request: JsonObject) -> _Response:
+        """
+        Sign `request["document"]` into `request["property"]`
+        (by default `"signature"`) with the configured key
+        `request["keyId"]`, the algorithm `request["algorithm"]`
+        and the header `request["header"]`, if any.
+        `request["mode"]` is `"single"` (the default),
+        `"multiple"` or `"chain"`.
+        """
+        key = self.keys.get(request['keyId'])
+        if key is None:
+            return 400, {'error': 'Unknown key id'}
+        jsf = JSF(request['document'])
+        add = {'single': jsf.add_single_signature,
+               'multiple': jsf.add_signature,
+               'chain': jsf.add_chain_signature}[
+                   request.get('mode', 'single')]
+        add(request.get('property', 'signature'), key,
+            request.get('algorithm'), request.get('header'))
+        return 200, {'document': jsf.payload}
+
+    def _run_batch(self, batch: List[_Job]) -> List[_Response]:
+        responses: List[_Response] = []
+        for deadline, cost, _, handler, request, _ in batch:
+            start = monotonic()
+            if start + cost * self.model.scale > deadline:
+                responses.append((504, {'error': 'Deadline missed',
+                                        'skipped': True}))
+                continue
+            try:
+                responses.append(handler(request))
+            except Exception as e:
+                responses.append((400, {'error': repr(e)}))
+            if handler == self.verify:
+                self.model.observe(cost, monotonic() - start)
+        return responses
+
+    async def start(self) -> None:
+        """
+        Start dispatching requests, in the running event loop.
+        """
+        self._queue = asyncio.PriorityQueue(self.queue_size)
+        self._executor = ThreadPoolExecutor(self.workers)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def close(self) -> None:
+        """
+        Stop dispatching requests and the worker threads.
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    async def _dispatch(self) -> None:
+        assert self._queue is not None
+        slots = asyncio.Semaphore(self.workers)
+        while True:
+            batch = [await self._queue.get()]
+            if self.max_delay:
+                await asyncio.sleep(self.max_delay)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            # Wait for a free worker, leaving the rest queued
+            await slots.acquire()
+            asyncio.ensure_future(self._send(batch)).add_done_callback(
+                lambda _: slots.release())
+
+    async def _send(self, batch: List[_Job]) -> None:
+        self.metrics.add_batch(len(batch))
+        loop = asyncio.get_running_loop()
+        try:
+            responses = await loop.run_in_executor(
+                self._executor, self._run_batch, batch)
+        except Exception as e:
+            responses = [(500, {'error': repr(e)})] * len(batch)
+        for job, response in zip(batch, responses):
+            if response[0] == 504:
+                self.metrics.skipped += 1
+            if not job[-1].done():
+                job[-1].set_result(response)
+
+    async def handle(self, method: str, path: str, body: bytes) -> _Response:
+        """
+        Answer an HTTP request.
+        """
+        if path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            return 200, self.metrics.snapshot(
+                self._queue.qsize() if self._queue is not None else 0)
+        handler = self._handlers.get(path)
+        if handler is None:
+            return 404, {'error': 'Not found'}
+        if method != 'POST':
+            return 405, {'error': 'Use POST'}
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            return 400, {'error': 'Invalid JSON: {}'.format(e)}
+        if not isinstance(request, dict) or not isinstance(
+                request.get('document'), dict):
+            return 400, {'error': 'Expected an object with a "document"'}
+        timeout = request.get('timeout', self.timeout)
+        if timeout is not None and not isinstance(timeout, (int, float)):
+            return 400, {'error': 'Expected a number of seconds as "timeout"'}
+        alg = request.get('algorithm')
+        if not isinstance(request.get('property', ''), str) or (
+                alg is not None and not isinstance(alg, str)):
+            return 400, {'error': 'Expected strings as "property" '
+                                  'and "algorithm"'}
+        deadline = (monotonic() + timeout if timeout is not None
+                    else float('inf'))
+        if handler == self.verify:
+            cost = self.model.estimate(
+                request['document'], request.get('property', 'signature'),
+                alg=alg, size=len(body))
+        else:
+            cost = self.model.document_cost + len(body) * self.model.byte_cost
+        assert self._queue is not None
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((deadline, cost, next(self._arrivals),
+                                    handler, request, future))
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            return 503, {'error': 'Too many requests'}
+        return await future
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body: int
+                        ) -> Optional[Tuple[str, str, Dict[str, str],
+                                            Optional[bytes]]]:
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, _ = line.decode('latin-1').split(' ', 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0))
+    if length > max_body:
+        return method, path, headers, None
+    body = await reader.readexactly(length) if length else b''
+    return method, path, headers, body
+
+
+def _write_response(writer: asyncio.StreamWriter, status: int,
+                    body: JsonObject, close: bool) -> None:
+    data = json.dumps(body).encode('utf-8')
+    writer.write(
+        'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\n'
+        'Content-Length: {}\r\nConnection: {}\r\n\r\n'.format(
+            status, _REASONS.get(status, 'Error'), len(data),
+            'close' if close else 'keep-alive').encode('latin-1') + data)
+
+
+async def start_server(service: VerificationService, *,
+                       host: Optional[str] = None,
+                       port: Optional[int] = None,
+                       max_body: int = 1 << 20) -> asyncio.AbstractServer:
+    """
+    Start `service` and serve it over HTTP/1.1 on `host` and `port`.
+    Close the service after the server.
+
+    :param max_body: The maximum size of a request body, in bytes.
+    """
+    await service.start()
+
+    async def serve(reader: asyncio.StreamReader,
+                    writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader, max_body)
+                except (ValueError, asyncio.IncompleteReadError):
+                    _write_response(writer, 400,
+                                    {'error': 'Malformed request'}, True)
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                path = path.split('?', 1)[0]
+                close = headers.get('connection', '').lower() == 'close'
+                start = perf_counter()
+                if body is None:
+                    status, response = 413, {'error': 'Body too large'}
+                    close = True
+                else:
+                    status, response = await service.handle(method, path,
+                                                            body)
+                _write_response(writer, status, response, close)
+                await writer.drain()
+                service.metrics.add(path, status, perf_counter() - start)
+                if close:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(serve, host=host, port=port)
@@ -0,0 +1,357 @@
+"""
+Signer backends for keys that live outside of the signing process,
+such as a remote signing service or an HSM.
+
+Backends sign prehashed digests (see `jsf.SigningRequest`),
+so only the digests cross over to the key holder.
+Where round trips dominate, wrap a backend in a `BatchingSigner`
+to coalesce concurrent requests into batched calls.
+"""
+
+from abc import ABC, abstractmethod
+import asyncio
+import json
+from typing import (
+    TYPE_CHECKING, Dict, List, Optional, Sequence, Set, Tuple, Union)
+
+from . import JSF, AlgorithmName, JsonObject, SigningRequest, sign_digest
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+SignItem = Tuple[AlgorithmName, bytes]
+"""
+An algorithm and a digest to sign with it.
+"""
+
+SignResult = Union[bytes, Exception]
+"""
+A raw signature, or the error signing a digest.
+"""
+
+
+class Signer(ABC):
+    """
+    An asynchronous signer backend holding a single private key.
+    """
+
+    @abstractmethod
+    async def sign_batch(self, items: Sequence[SignItem]
+                         ) -> List[SignResult]:
+        """
+        Sign several digests in one call.
+
+        :returns: The raw signatures, in the order of `items`,
+        or the errors of the digests that could not be signed.
+
+        :raises Exception: if none could be signed.
+        """
+
+    async def sign(self, alg: AlgorithmName, digest: bytes) -> bytes:
+        """
+        Sign a single digest.
+        """
+        result = (await self.sign_batch([(alg, digest)]))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    async def close(self) -> None:
+        """
+        Release the resources held by the backend.
+        """
+
+
+class LocalSigner(Signer):
+    """
+    An in-process backend, for tests and as a stand-in for remote ones.
+
+    :param latency: Simulated round trip time of each call, in seconds.
+    """
+
+    def __init__(self, key: 'JWK', latency: float = 0.0) -> None:
+        self.key = key
+        self.latency = latency
+        self.calls = 0
+
+    async def sign_batch(self, items: Sequence[SignItem]
+                         ) -> List[SignResult]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        results: List[SignResult] = []
+        for alg, digest in items:
+            try:
+                results.append(sign_digest(self.key, alg, digest))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+MAX_MESSAGE = 1 << 24
+"""
+The default maximum size of a message between `SocketSigner`
+and `start_signer_server`, in bytes: thousands of signatures with
+the largest RSA keys, where the default of `asyncio` streams,
+64 KiB, would not fit a batch of 64 signatures with 8192-bit keys.
+"""
+
+
+async def _read_message(reader: asyncio.StreamReader) -> Optional[JsonObject]:
+    line = await reader.readline()
+    return json.loads(line.decode('utf-8')) if line else None
+
+
+def _write_message(writer: asyncio.StreamWriter, message: JsonObject) -> None:
+    writer.write(json.dumps(message).encode('utf-8') + b'\n')
+
+
+async def start_signer_server(keys: Dict[str, 'JWK'], *,
+                              path: Optional[str] = None,
+                              host: Optional[str] = None,
+                              port: Optional[int] = None,
+                              limit: int = MAX_MESSAGE
+                              ) -> asyncio.AbstractServer:
+    """
+    Serve `keys` to `SocketSigner` clients on a Unix socket at `path`,
+    or on a TCP socket at `host` and `port`.
+
+    The protocol is one JSON object per line:
+    `{"keyId": ..., "items": [{"algorithm": ..., "digest": ...}, ...]}`
+    is answered with `{"signatures": [...]}`, holding a signature
+    or an `{"error": ...}` object per item, or with `{"error": ...}`
+    if the request fails as a whole,
+    digests and signatures being base64url encoded.
+
+    :param keys: The private keys, by key id.
+
+    :param limit: The maximum size of a message, in bytes;
+    a larger one closes the connection.
+    """
+    from jwcrypto.common import base64url_decode, base64url_encode
+
+    def sign_item(key: 'JWK', item: JsonObject) -> Union[str, JsonObject]:
+        try:
+            return base64url_encode(sign_digest(
+                key, item['algorithm'], base64url_decode(item['digest'])))
+        except Exception as e:
+            return {'error': repr(e)}
+
+    async def serve(reader: asyncio.StreamReader,
+                    writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request = await _read_message(reader)
+                if request is None:
+                    break
+                try:
+                    key = keys[request['keyId']]
+                    signatures = [sign_item(key, item)
+                                  for item in request['items']]
+                except Exception as e:
+                    _write_message(writer, {'error': repr(e)})
+                else:
+                    _write_message(writer, {'signatures': signatures})
+                await writer.drain()
+        finally:
+            writer.close()
+
+    if path is not None:
+        return await asyncio.start_unix_server(serve, path=path, limit=limit)
+    return await asyncio.start_server(serve, host=host, port=port,
+                                      limit=limit)
+
+
+class SocketSigner(Signer):
+    """
+    A client for `start_signer_server`, keeping a pool of connections.
+
+    :param key_id: The key to sign with.
+
+    :param pool_size: The maximum number of open connections,
+    and thus of calls in flight.
+
+    :param limit: The maximum size of a message, in bytes;
+    a batch whose signatures do not fit fails.
+    """
+
+    def __init__(self, key_id: str, *, path: Optional[str] = None,
+                 host: Optional[str] = None, port: Optional[int] = None,
+                 pool_size: int = 4, limit: int = MAX_MESSAGE) -> None:
+        self.key_id = key_id
+        self._path = path
+        self._host = host
+        self._port = port
+        self._limit = limit
+        self._slots = asyncio.Semaphore(pool_size)
+        self._idle: List[Tuple[asyncio.StreamReader,
+                               asyncio.StreamWriter]] = []
+
+    async def _connect(self) -> Tuple[asyncio.StreamReader,
+                                      asyncio.StreamWriter]:
+        if self._idle:
+            return self._idle.pop()
+        if self._path is not None:
+            return await asyncio.open_unix_connection(self._path,
+                                                      limit=self._limit)
+        return await asyncio.open_connection(self._host, self._port,
+                                             limit=self._limit)
+
+    async def sign_batch(self, items: Sequence[SignItem]
+                         ) -> List[SignResult]:
+        from jwcrypto.common import base64url_decode, base64url_encode
+
+        async with self._slots:
+            reader, writer = await self._connect()
+            try:
+                _write_message(writer, {
+                    'keyId': self.key_id,
+                    'items': [{'algorithm': alg,
+                               'digest': base64url_encode(digest)}
+                              for alg, digest in items]})
+                await writer.drain()
+                response = await _read_message(reader)
+            except BaseException:
+                writer.close()
+                raise
+            if response is None:
+                writer.close()
+                raise ConnectionError('Signer server closed the connection')
+            self._idle.append((reader, writer))
+        if 'error' in response:
+            raise RuntimeError(
+                'Signer server failed: {}'.format(response['error']))
+        return [base64url_decode(s) if isinstance(s, str) else
+                RuntimeError('Signer server failed: {}'.format(s['error']))
+                for s in response['signatures']]
+
+    async def close(self) -> None:
+        while self._idle:
+            _, writer = self._idle.pop()
+            writer.close()
+
+
+class BatchingSigner(Signer):
+    """
+    Coalesce concurrent `sign` calls into `sign_batch` calls
+    on another backend.
+
+    A batch is sent when `max_batch` digests are waiting,
+    or `max_delay` seconds after the first one arrived.
+
+    :param max_concurrency: The maximum number of batches in flight.
+    """
+
+    def __init__(self, backend: Signer, max_batch: int = 64,
+                 max_delay: float = 0.002, max_concurrency: int = 4) -> None:
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._pending: List[Tuple[AlgorithmName, bytes,
+                                  'asyncio.Future[bytes]']] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set['asyncio.Task[None]'] = set()
+
+    async def sign(self, alg: AlgorithmName, digest: bytes) -> bytes:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((alg, digest, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    async def sign_batch(self, items: Sequence[SignItem]
+                         ) -> List[SignResult]:
+        results = await asyncio.gather(
+            *(self.sign(alg, digest) for alg, digest in items),
+            return_exceptions=True)
+        for result in results:
+            # Cancellation is not a signing error
+            if (isinstance(result, BaseException) and
+                    not isinstance(result, Exception)):
+                raise result
+        return list(results)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[Tuple[AlgorithmName, bytes,
+                                             'asyncio.Future[bytes]']]
+                    ) -> None:
+        # Every future is resolved, whatever happens: those left without
+        # a result, if the task is cancelled, are cancelled as well
+        results: Sequence[SignResult] = ()
+        try:
+            async with self._slots:
+                results = await self.backend.sign_batch(
+                    [(alg, digest) for alg, digest, _ in batch])
+            if len(results) != len(batch):
+                results = [RuntimeError(
+                    'Signer returned {} results for {} digests'.format(
+                        len(results), len(batch)))] * len(batch)
+        except Exception as e:
+            results = [e] * len(batch)
+        finally:
+            for i, (_, _, future) in enumerate(batch):
+                if future.done():
+                    continue
+                if i >= len(results):
+                    future.cancel()
+                    continue
+                result = results[i]
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self) -> None:
+        self._flush()
+        if self._tasks:
+            await asyncio.wait(self._tasks)
+        await self.backend.close()
+
+
+async def _sign(jsf: JSF, request: SigningRequest, signer: Signer) -> None:
+    signature = await signer.sign(request.algorithm, request.digest)
+    jsf.finalize_signature(request, signature)
+
+
+async def add_single_signature(
+        jsf: JSF, prop: str, signer: Signer,
+        alg: Optional[AlgorithmName] = None,
+        header: Optional[JsonObject] = None) -> None:
+    """
+    Like `JSF.add_single_signature`, with the key held by `signer`.
+    """
+    await _sign(jsf, jsf.prepare_single_signature(prop, alg, header), signer)
+
+
+async def add_signature(
+        jsf: JSF, prop: str, signer: Signer,
+        alg: Optional[AlgorithmName] = None,
+        header: Optional[JsonObject] = None) -> None:
+    """
+    Like `JSF.add_signature`, with the key held by `signer`.
+    """
+    await _sign(jsf, jsf.prepare_signature(prop, alg, header), signer)
+
+
+async def add_chain_signature(
+        jsf: JSF, prop: str, signer: Signer,
+        alg: Optional[AlgorithmName] = None,
+        header: Optional[JsonObject] = None) -> None:
+    """
+    Like `JSF.add_chain_signature`, with the key held by `signer`.
+    """
+    await _sign(jsf, jsf.prepare_chain_signature(prop, alg, header), signer)
@@ -0,0 +1,188 @@
+"""
+Streaming signing of documents too large to hold in memory.
+
+A `StreamSigner` takes the top-level members of a document one at a time,
+in canonical order, writes them to a binary stream (a file, or
+`socket.makefile('wb')`) and hashes them as they go;
+members whose value is an iterator, such as a generator or
+a database cursor, are written as arrays an item at a time.
+Closing the signer appends the signature object to the document,
+so only the largest member or array item is ever held in memory.
+
+The signing input is the canonical document with the signature object,
+minus its value, among its members, as JSF specifies; the document written
+is the same with the signature object at the end, which is canonical
+only if the signature property comes last in canonical order,
+but verifies all the same.
+
+The hash can only be computed incrementally by the algorithms signing
+a digest (HMAC, ECDSA, RSASSA-PKCS1-v1_5 and RSASSA-PSS),
+not by EdDSA.
+"""
+
+from copy import copy
+from hashlib import new
+import hmac
+from typing import (
+    TYPE_CHECKING, Any, BinaryIO, Iterator, Optional)
+
+from . import (
+    JSF, AlgorithmName, JsonObject, _ALGORITHM, _EXTENSIONS, _VALUE,
+    _can_prehash, _hash_name, sign_digest)
+from .canonical import Canonicalizer, _encode_name
+
+if TYPE_CHECKING:
+    from jwcrypto.jwk import JWK
+
+
+class StreamSigner:
+    """
+    Write and sign a document member by member with a single `key`,
+    like `JSF.add_single_signature`.
+
+    :param out: Where to write the document.
+
+    :param prop: The signature property.
+
+    :param alg: The signing algorithm.
+    Can be omitted if provided in the `header`.
+
+    :param header: The header providing the algorithm parameters.
+
+    :param canonicalizer: By default, `JSF.canonicalizer`;
+    its limits apply to each member.
+    """
+
+    def __init__(self, out: BinaryIO, prop: str, key: 'JWK',
+                 alg: Optional[AlgorithmName] = None,
+                 header: Optional[JsonObject] = None,
+                 canonicalizer: Optional[Canonicalizer] = None) -> None:
+        from jwcrypto.common import base64url_decode, json_decode, json_encode
+        from jwcrypto.jws import InvalidJWSOperation
+
+        jsf = JSF()
+        self.canonicalizer = (canonicalizer if canonicalizer is not None
+                              else jsf.canonicalizer)
+        h = json_decode(json_encode(header or {}))
+        jsf._check_extensions(h.get(_EXTENSIONS, []))
+        self.algorithm = jsf._get_alg(alg, h, ValueError)
+        if self.algorithm not in jsf.allowed_algs:
+            raise InvalidJWSOperation('Algorithm not allowed')
+        h.setdefault(_ALGORITHM, self.algorithm)
+        h.pop(_VALUE, None)
+
+        hash_name = _hash_name(self.algorithm)
+        self._hash: Any
+        if self.algorithm.startswith('HS'):
+            self._hash = hmac.new(
+                base64url_decode(key.get_op_key('sign')), digestmod=hash_name)
+        elif _can_prehash(self.algorithm):
+            self._hash = new(hash_name)
+        else:
+            raise InvalidJWSOperation(
+                'Algorithm "{}" cannot sign a stream'.format(self.algorithm))
+
+        self.out = out
+        self.prop = prop
+        self.key = key
+        self.header = h
+        self.signature: Optional[JsonObject] = None
+        """The signature object, once closed."""
+        self._prop_order = prop.encode('utf-16-be')
+        self._last: Optional[bytes] = None
+        # Whether the signature member was hashed
+        self._hashed_header = False
+        # Whether a member was hashed, and written
+        self._hashed = self._written = False
+        self._hash.update(b'{')
+        self.out.write(b'{')
+
+    def _emit(self, data: bytes) -> None:
+        self._hash.update(data)
+        self.out.write(data)
+
+    def _separate(self) -> None:
+        if self._hashed:
+            self._hash.update(b',')
+        if self._written:
+            self.out.write(b',')
+        self._hashed = self._written = True
+
+    def _hash_header(self) -> None:
+        if self._hashed:
+            self._hash.update(b',')
+        self._hashed = True
+        self._hash.update(self.canonicalizer.dump_member(self.prop,
+                                                         self.header))
+        self._hashed_header = True
+
+    def _emit_value(self, value: Any) -> None:
+        if not isinstance(value, Iterator):
+            self._emit(self.canonicalizer.dumps(value))
+            return
+        self._emit(b'[')
+        for i, item in enumerate(value):
+            if i:
+                self._emit(b',')
+            self._emit_value(item)
+        self._emit(b']')
+
+    def member(self, name: str, value: Any) -> None:
+        """
+        Write a member of the document.
+
+        :param value: A JSON value, or an iterator of the items
+        of an array (which can be iterators themselves).
+
+        :raises ValueError: if `name` is not after the previous member
+        in canonical order, or is the signature property.
+        """
+        prefix = _encode_name(name).encode('utf-8')
+        order = name.encode('utf-16-be')
+        if self.signature is not None:
+            raise ValueError('Signer already closed')
+        if name == self.prop:
+            raise ValueError('"{}" is the signature property'.format(name))
+        if self._last is not None and order <= self._last:
+            raise ValueError('Member "{}" out of canonical order'
+                             .format(name))
+        self._last = order
+        if not self._hashed_header and self._prop_order < order:
+            self._hash_header()
+        self._separate()
+        self._emit(prefix)
+        self._emit_value(value)
+
+    def close(self) -> JsonObject:
+        """
+        Sign the document and write the signature object.
+
+        :returns: The signature object.
+        """
+        from jwcrypto.common import base64url_encode
+
+        if self.signature is not None:
+            return self.signature
+        if not self._hashed_header:
+            self._hash_header()
+        self._hash.update(b'}')
+        if isinstance(self._hash, hmac.HMAC):
+            value = self._hash.digest()
+        else:
+            value = sign_digest(self.key, self.algorithm,
+                                self._hash.digest())
+        signature = copy(self.header)
+        signature[_VALUE] = base64url_encode(value)
+        if self._written:
+            self.out.write(b',')
+        self.out.write(self.canonicalizer.dump_member(self.prop, signature))
+        self.out.write(b'}')
+        self.signature = signature
+        return signature
+
+    def __enter__(self) -> 'StreamSigner':
+        return self
+
+    def __exit__(self, exc_type: Optional[type], *args: Any) -> None:
+        if exc_type is None:
+            self.close()
@@ -0,0 +1,129 @@
+import json
+
+import pytest
+
+from jsf import JSF, JWK, VerificationFailed
+from jsf.archive import ArchiveReader, ArchiveWriter, index_path
+from jsf.batch import ErrorCode
+
+
+eckey = JWK.generate(kty='EC', crv='P-256', kid='ec')
+hskey = JWK.generate(kty='oct', size=256)
+
+
+def signed(i, key=eckey, alg='ES256'):
+    jsf = JSF({'id': i, 'data': 'x' * i})
+    jsf.add_single_signature('signature', key, alg,
+                             {'publicKey': key.export_public(True)}
+                             if key is eckey else {'keyId': 'hs'})
+    return jsf
+
+
+def archive(tmp_path, count=5):
+    path = str(tmp_path / 'audit.jsfa')
+    with ArchiveWriter(path) as writer:
+        for i in range(count):
+            assert writer.append(signed(i)) == i
+    return path
+
+
+def test_read(tmp_path):
+    path = archive(tmp_path)
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 5
+        assert reader.document(3)['id'] == 3
+        assert (bytes(reader.canonical(-1)) ==
+                JSF.canonicalizer.dumps(reader.document(4)))
+        assert [d['id'] for d in reader] == list(range(5))
+        metadata = reader.metadata(2)
+        assert metadata['mode'] == 'single'
+        assert metadata['signers'] == [{'algorithm': 'ES256', 'keyId': None,
+                                        'thumbprint': eckey.thumbprint()}]
+        assert all(reader.check(i) for i in range(5))
+
+
+def test_verify(tmp_path):
+    path = str(tmp_path / 'audit.jsfa')
+    with ArchiveWriter(path) as writer:
+        writer.append(signed(0))
+        writer.append(signed(1, hskey, 'HS256').payload)
+        writer.append(dict(signed(2).payload, id=3))
+    with ArchiveReader(path) as reader:
+        assert reader.verify(0) == ErrorCode.VALID
+        assert reader.verify(1) == ErrorCode.MALFORMED
+        assert reader.verify(1, key=hskey) == ErrorCode.VALID
+        assert reader.verify(2) == ErrorCode.INVALID
+        assert reader.verify(-1) == ErrorCode.INVALID
+        assert reader.verify(-3) == ErrorCode.VALID
+        with pytest.raises(IndexError):
+            reader.verify(3)
+        mask, errors = reader.verify_range(0, 3, numpy=False)
+        assert list(errors) == [0, 2, 1]
+
+
+
+def test_append_verified(tmp_path):
+    path = str(tmp_path / 'audit.jsfa')
+    document = signed(1).payload
+    with ArchiveWriter(path, verify=True) as writer:
+        writer.append(document)
+        with pytest.raises(VerificationFailed):
+            writer.append(dict(signed(2).payload, id=3))
+    with ArchiveReader(path) as reader:
+        assert len(reader) == 1
+        assert reader.check(0) and reader.verify(0) == ErrorCode.VALID
+        assert (bytes(reader.canonical(0)) ==
+                JSF.canonicalizer.dumps(document))
+
+
+def test_corruption(tmp_path):
+    path = archive(tmp_path)
+    with ArchiveReader(path) as reader:
+        canonical = bytes(reader.canonical(2))
+    with open(path, 'r+b') as f:
+        data = f.read()
+        at = data.index(canonical) + canonical.index(b'xx')
+        f.seek(at)
+        f.write(b'y')
+    with ArchiveReader(path) as reader:
+        assert not reader.check(2)
+        assert list(reader.verify_range(numpy=False).errors) == [0, 0, 2, 0, 0]
+
+
+def test_metadata_corruption(tmp_path):
+    path = archive(tmp_path)
+    with ArchiveReader(path) as reader:
+        metadata = json.dumps(reader.metadata(1),
+                              separators=(',', ':')).encode('utf-8')
+        start = bytes(reader._data).index(bytes(reader.canonical(1)))
+    with open(path, 'r+b') as f:
+        f.seek(start + f.read()[start:].index(metadata) + 2)
+        f.write(b'\xff')
+    with ArchiveReader(path) as reader:
+        assert reader.check(0) and not reader.check(1)
+        assert list(reader.verify_range(numpy=False).errors) == [0, 2, 0, 0, 0]
+        assert list(reader.sweep(workers=2, chunk_size=2,
+                                 numpy=False).errors) == [0, 2, 0, 0, 0]
+
+
+def test_sweep(tmp_path):
+    path = archive(tmp_path, count=10)
+    with ArchiveReader(path) as reader:
+        assert list(reader.sweep(workers=2, chunk_size=3,
+                                 numpy=False).mask) == [1] * 10
+        assert list(reader.sweep(workers=1, numpy=False).mask) == [1] * 10
+
+
+def test_recovery(tmp_path):
+    path = archive(tmp_path, count=3)
+    # A crash after writing the data of an entry, and part of another
+    with open(index_path(path), 'r+b') as f:
+        f.truncate(f.seek(0, 2) - 10)
+    with open(path, 'ab') as f:
+        f.write(b'\x10\x00')
+    with ArchiveWriter(path) as writer:
+        assert len(writer) == 3
+        writer.append(signed(3))
+    with ArchiveReader(path) as reader:
+        assert [d['id'] for d in reader] == [0, 1, 2, 3]
+        assert list(reader.verify_range(numpy=False).mask) == [1] * 4
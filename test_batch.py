@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from jsf import JSF, JWK
+from jsf.batch import ErrorCode, verify_batch
+
+
+eckey = JWK.generate(kty='EC', crv='P-256')
+hskey = JWK.generate(kty='oct', size=256)
+
+
+def signed(i, key=eckey, alg='ES256', header=None):
+    jsf = JSF({'id': i, 'name': 'row {}'.format(i)})
+    jsf.add_single_signature('signature', key, alg, header)
+    return jsf.payload
+
+
+def rows():
+    embedded = {'publicKey': eckey.export_public(True)}
+    valid = signed(0, header=embedded)
+    return [
+        valid,
+        dict(valid, id=1),
+        json.dumps(signed(2, header=embedded)),
+        'not json',
+        {'id': 4},
+        dict(valid, signature=dict(valid['signature'], value='AAAA')),
+        signed(6, hskey, 'HS256'),
+        {'id': 7, 'signature': {'signers': [
+            dict(signed(7, header=embedded)['signature'])]}},
+    ]
+
+
+def test_verify_batch():
+    mask, errors = verify_batch(rows(), 'signature', numpy=False)
+    assert list(mask) == [1, 0, 1, 0, 0, 0, 0, 0]
+    assert list(errors) == [
+        ErrorCode.VALID, ErrorCode.INVALID, ErrorCode.VALID,
+        ErrorCode.MALFORMED, ErrorCode.MALFORMED, ErrorCode.SIGNATURE,
+        ErrorCode.MALFORMED, ErrorCode.INVALID]
+
+
+def test_verify_batch_key():
+    tampered = dict(signed(2, hskey, 'HS256'), id=3)
+    mask, errors = verify_batch([signed(0, hskey, 'HS256'), signed(1),
+                                 tampered],
+                                'signature', key=hskey, numpy=False)
+    assert list(mask) == [1, 0, 0]
+    assert list(errors) == [ErrorCode.VALID, ErrorCode.KEY,
+                            ErrorCode.INVALID]
+
+
+def test_verify_batch_allowed_algs():
+    _, errors = verify_batch([signed(0, hskey, 'HS256')], 'signature',
+                             key=hskey, allowed_algs=['ES256'], numpy=False)
+    assert list(errors) == [ErrorCode.ALGORITHM]
+
+
+def test_verify_batch_matches_verify():
+    documents = rows()
+    mask, _ = verify_batch(documents, 'signature', numpy=False)
+    for document, ok in zip(documents, mask):
+        if isinstance(document, str):
+            try:
+                document = json.loads(document)
+            except ValueError:
+                continue
+        jsf = JSF(document)
+        try:
+            jsf.verify('signature')
+        except Exception:
+            assert not ok
+        else:
+            assert ok
+
+
+def test_verify_batch_numpy():
+    np = pytest.importorskip('numpy')
+    column = np.empty(3, dtype=object)
+    column[:] = [signed(0, header={'publicKey': eckey.export_public(True)}),
+                 {'id': 1}, None]
+    mask, errors = verify_batch(column, 'signature')
+    assert mask.dtype == np.bool_ and errors.dtype == np.uint8
+    assert mask.tolist() == [True, False, False]
@@ -0,0 +1,298 @@
+from dataclasses import asdict, dataclass
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+from jsf import JSF, InvalidJWSSignature, JWK, PrevalidationFailed
+from jsf.canonical import (
+    CanonicalizationError, Canonicalizer, TrackedDict, TrackedList, track)
+from org.webpki.json.Canonicalize import canonicalize as _dumpb
+
+
+samples = [
+    {'numbers': [333333333.33333329, 1E30, 4.50, 2e-3,
+                 0.000000000000000000000000001,
+                 -0.0, 2 ** 53, -2 ** 60, 10 ** 21, 7]},
+    {'string': '€$\u000F\u000aA\'B"\\\"/',
+     'literals': [None, True, False]},
+    {'€': 'Euro Sign', '\r': 'Carriage Return', 'דּ': 'Hebrew Letter',
+     '1': 'One', '\U0001f600': 'Emoji', '\u0080': 'Control', 'ö': 'Latin'},
+    [[], {}, (1, 2), [{'b': [], 'a': {}}]],
+    'top-level string',
+]
+
+
+@pytest.mark.parametrize('obj', samples)
+def test_matches_recursive(obj):
+    assert Canonicalizer().dumps(obj) == _dumpb(obj)
+
+
+def test_dump_members():
+    obj = samples[2]
+    members = Canonicalizer().dump_members(obj)
+    assert members.keys() == obj.keys()
+    assert members['1'] == b'"1":"One"'
+
+
+def deep(levels):
+    obj = inner = []
+    for _ in range(levels):
+        inner.append([])
+        inner = inner[0]
+    return obj
+
+
+def test_deep():
+    assert Canonicalizer().dumps(deep(100000)) == b'[' * 100001 + b']' * 100001
+
+
+def test_max_depth():
+    Canonicalizer(max_depth=10).dumps(deep(9))
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_depth=10).dumps(deep(10))
+
+
+def test_max_size():
+    Canonicalizer(max_size=7).dumps([1, 2, 3])
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_size=6).dumps([1, 2, 3])
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_size=20).dump_members({'a': 'x' * 8, 'b': 'y' * 8})
+
+
+def test_circular():
+    obj = []
+    obj.append(obj)
+    with pytest.raises(ValueError):
+        Canonicalizer().dumps(obj)
+
+
+@pytest.mark.parametrize('obj', [{1: 2}, {'a': object()}])
+def test_not_json(obj):
+    with pytest.raises(TypeError):
+        Canonicalizer().dumps(obj)
+
+
+def test_verify_limits():
+    key = JWK.generate(kty='EC', crv='P-256')
+    jsf = JSF({'deep': deep(50)})
+    jsf.add_single_signature('signature', key, 'ES256')
+    JSF(jsf.payload).verify('signature', key=key)
+    limited = JSF(jsf.payload)
+    limited.canonicalizer = Canonicalizer(max_depth=20)
+    with pytest.raises(InvalidJWSSignature):
+        limited.verify('signature', key=key)
+
+
+@pytest.mark.parametrize('obj', [s for s in samples if isinstance(s, dict)])
+def test_check_limits(obj):
+    size = len(_dumpb(obj).decode('utf-8'))
+    Canonicalizer(max_size=size).check_limits(obj)
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_size=3).check_limits(obj)
+
+
+@pytest.mark.parametrize('levels', [8, 9, 10])
+def test_check_limits_depth(levels):
+    obj = {'deep': deep(levels), 'tracked': track({'a': deep(levels)})}
+    Canonicalizer().dumps(obj['tracked'])
+    canonicalizer = Canonicalizer(max_depth=10)
+    try:
+        canonicalizer.dump_members(obj)
+    except CanonicalizationError:
+        with pytest.raises(CanonicalizationError):
+            canonicalizer.check_limits(obj)
+    else:
+        canonicalizer.check_limits(obj)
+
+
+def test_verify_limits_early():
+    key = JWK.generate(kty='EC', crv='P-256')
+    jsf = JSF({'big': ['x' * 100] * 100})
+    jsf.add_single_signature('signature', key, 'ES256')
+
+    class Counting(Canonicalizer):
+        calls = 0
+
+        def dump_members(self, *args, **kwargs):
+            Counting.calls += 1
+            return super().dump_members(*args, **kwargs)
+
+    limited = JSF(jsf.payload)
+    limited.canonicalizer = Counting(max_size=5000)
+    with pytest.raises(PrevalidationFailed) as e:
+        limited.verify('signature', key=key)
+    assert e.value.reason == 'payload'
+    assert Counting.calls == 0
+
+
+@dataclass
+class Item:
+    sku: str
+    quantity: int
+    price: float
+
+
+@dataclass
+class Order:
+    id: int
+    customer: str
+    items: List[Item]
+    notes: Optional[str] = None
+    signature: Optional[Dict[str, Any]] = None
+
+
+@dataclass(frozen=True)
+class FrozenOrder:
+    id: int
+    customer: str
+    items: Tuple[Item, ...]
+    notes: Optional[str]
+    signature: Dict[str, Any]
+
+
+def make_order():
+    return Order(2200063, 'Jöe €', [Item('a-1', 2, 9.99),
+                                        Item('b-2', 1, 1e21)])
+
+
+def test_record():
+    order = make_order()
+    assert Canonicalizer().dumps(order) == _dumpb(asdict(order))
+    members = Canonicalizer().dump_members(order, skip='signature')
+    assert list(members) == ['customer', 'id', 'items', 'notes']
+
+
+def test_record_sign_verify():
+    key = JWK.generate(kty='EC', crv='P-256')
+    order = make_order()
+    jsf = JSF(order)
+    jsf.add_single_signature('signature', key, 'ES256')
+    assert order.signature['algorithm'] == 'ES256'
+    assert jsf.canonical == _dumpb(asdict(order))
+    JSF(asdict(order)).verify('signature', key=key)
+
+    frozen = FrozenOrder(order.id, order.customer, tuple(order.items),
+                         order.notes, order.signature)
+    jsf = JSF(frozen)
+    jsf.verify('signature', key=key)
+    assert jsf.payload is frozen
+
+
+def test_record_sign_multiple():
+    key = JWK.generate(kty='EC', crv='P-256')
+    order = make_order()
+    jsf = JSF(order)
+    jsf.add_signature('signature', key, 'ES256')
+    jsf.add_signature('signature', key, 'ES256')
+    assert len(order.signature['signers']) == 2
+    JSF(asdict(order)).verify('signature', key=key)
+
+
+def test_record_without_signature_field():
+    jsf = JSF(Item('a-1', 2, 9.99))
+    with pytest.raises(KeyError):
+        jsf.add_single_signature('signature',
+                                 JWK.generate(kty='EC', crv='P-256'), 'ES256')
+
+
+def test_attrs_record():
+    attr = pytest.importorskip('attr')
+
+    @attr.s
+    class Point:
+        y = attr.ib()
+        x = attr.ib()
+
+    assert Canonicalizer().dumps([Point(1, 2)]) == b'[{"x":2,"y":1}]'
+
+
+def test_shape_cache():
+    canonicalizer = Canonicalizer(shape_cache_size=2)
+    for i in range(3):
+        assert canonicalizer.dumps({'b': i, 'a': [{'x': 1}]}) == \
+            '{{"a":[{{"x":1}}],"b":{}}}'.format(i).encode()
+    assert canonicalizer.shape_cache_info() == (4, 2, 0, 2, 2)
+    canonicalizer.dumps({'c': 1})
+    info = canonicalizer.shape_cache_info()
+    assert (info.misses, info.evictions, info.size) == (3, 1, 2)
+    canonicalizer.shape_cache_clear()
+    assert canonicalizer.shape_cache_info() == (0, 0, 0, 0, 2)
+
+
+def test_shape_cache_limits():
+    canonicalizer = Canonicalizer(max_shape_members=2)
+    assert canonicalizer.dumps({'c': 3, 'b': 2, 'a': 1}) == \
+        b'{"a":1,"b":2,"c":3}'
+    assert canonicalizer.shape_cache_info().size == 0
+    assert Canonicalizer(shape_cache_size=0).dumps({'b': 2, 'a': 1}) == \
+        b'{"a":1,"b":2}'
+
+
+def make_state():
+    return {'name': 'state', 'version': 1,
+            'nodes': [{'id': i, 'tags': ['a', 'b'], 'data': {'x': i * 0.5}}
+                      for i in range(20)],
+            'meta': {'owner': 'Joe', 'limits': (1, 2)}}
+
+
+def test_track():
+    doc = track(make_state())
+    assert isinstance(doc, TrackedDict)
+    assert isinstance(doc['nodes'], TrackedList)
+    assert isinstance(doc['meta']['limits'], TrackedList)
+    assert track(doc) is doc
+
+    canonicalizer = Canonicalizer()
+    assert canonicalizer.dumps(doc) == _dumpb(make_state())
+    assert doc['nodes'][3]._fragment is not None
+
+    edits = [
+        lambda d: d['nodes'][3]['data'].update(x=-1),
+        lambda d: d['nodes'][5]['tags'].append('c'),
+        lambda d: d['nodes'].insert(0, {'id': -1}),
+        lambda d: d['nodes'].pop(),
+        lambda d: d['meta'].setdefault('extra', [{'deep': []}]),
+        lambda d: d['meta']['extra'][0]['deep'].extend([1, 2]),
+        lambda d: d['meta'].__delitem__('owner'),
+        lambda d: d['nodes'][2]['tags'].__setitem__(slice(0, 1), [[]]),
+        lambda d: d['nodes'][2]['tags'][0].append(3),
+        lambda d: d['nodes'].sort(key=lambda n: -n['id']),
+        lambda d: d.__setitem__('version', 2),
+    ]
+    plain = make_state()
+    for edit in edits:
+        edit(doc)
+        edit(plain)
+        assert canonicalizer.dumps(doc) == _dumpb(plain)
+
+
+def test_track_shared_subtree():
+    doc = track({'a': {'x': 1}, 'b': {}})
+    doc['b']['y'] = doc['a']
+    assert doc['b']['y'] is not doc['a']
+    Canonicalizer().dumps(doc)
+    doc['b']['y']['x'] = 2
+    assert Canonicalizer().dumps(doc) == b'{"a":{"x":1},"b":{"y":{"x":2}}}'
+
+
+def test_track_limits():
+    doc = track({'a': [[[1]]]})
+    Canonicalizer().dumps(doc)
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_depth=3).dumps(doc)
+    with pytest.raises(CanonicalizationError):
+        Canonicalizer(max_size=10).dumps(doc)
+
+
+def test_track_resign():
+    key = JWK.generate(kty='EC', crv='P-256')
+    doc = track(make_state())
+    jsf = JSF(doc)
+    jsf.add_single_signature('signature', key, 'ES256')
+    doc['nodes'][7]['data']['x'] = 'changed'
+    jsf.add_single_signature('signature', key, 'ES256')
+    plain = json.loads(json.dumps(doc))
+    assert jsf.canonical == _dumpb(plain)
+    JSF(plain).verify('signature', key=key)
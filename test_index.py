@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from jsf import JSF, JWK, InvalidJWSSignature
+from jsf.__main__ import main
+from jsf.archive import ArchiveWriter
+from jsf.index import SignerIndex
+
+
+# Its thumbprint starts with "-"
+eckey = JWK(**{
+    "kid": "ec",
+    "kty": "EC",
+    "crv": "P-256",
+    "x": "Pn6I7ahIYD_Ejwyikfnf-WEG9caN2y_uKqamFt-aQr8",
+    "y": "YbwrpRy7J6LNEieO5plx56-kGOdBJZ7NtxeoPq8FV-M",
+    "d": "iSAxP8XkiFuYs1a7px_mkADs26xxSu4Ezhgt7eCvNPk"
+})
+rsakey = JWK.generate(kty='RSA', size=2048, kid='rsa')
+
+
+def signed(i, *keys, add='add_single_signature'):
+    jsf = JSF({'id': i})
+    for key in keys:
+        alg = 'ES256' if key is eckey else 'RS256'
+        getattr(jsf, add)('signature', key, alg,
+                          {'publicKey': key.export_public(True),
+                           'keyId': key['kid']})
+    return jsf.payload
+
+
+def test_record(tmp_path):
+    with SignerIndex(str(tmp_path / 'signers')) as index:
+        index.verify(JSF(signed(1, eckey)), 'signature', 'a')
+        index.verify(JSF(signed(2, eckey, rsakey, add='add_signature')),
+                     'signature', 'b')
+        with pytest.raises(InvalidJWSSignature):
+            index.verify(JSF(dict(signed(3, rsakey), id=4)), 'signature',
+                         'c')
+        assert index.documents('ec') == ['a', 'b']
+        assert index.documents(rsakey.thumbprint()) == ['b', 'c']
+        a, = index.signatures(document='a')
+        assert (a.mode, a.key_id, a.thumbprint, a.algorithm, a.valid) == (
+            'single', 'ec', eckey.thumbprint(), 'ES256', True)
+        c, = index.signatures('rsa', document='c')
+        assert c.valid is False
+        # Recording a document again replaces its signers
+        index.verify(JSF(signed(1, rsakey)), 'signature', 'a')
+        assert index.documents('ec') == ['b']
+
+
+def test_verification_key(tmp_path):
+    jsf = JSF({'id': 1})
+    jsf.add_single_signature('signature', eckey, 'ES256', {'keyId': 'ec'})
+    with SignerIndex(str(tmp_path / 'signers')) as index:
+        index.verify(JSF(jsf.payload), 'signature', 'a', key=eckey)
+        assert index.documents(eckey.thumbprint()) == ['a']
+        assert list(index.revalidate('ec', lambda _: jsf.payload,
+                                     keys={'ec': eckey})) == [('a', True)]
+
+
+def test_revalidate(tmp_path):
+    documents = {'a': signed(1, eckey), 'b': signed(2, rsakey),
+                 'c': signed(3, eckey, rsakey, add='add_signature'),
+                 'd': signed(4, eckey, rsakey, add='add_chain_signature')}
+    with SignerIndex(str(tmp_path / 'signers')) as index:
+        for name, document in documents.items():
+            index.verify(JSF(document), 'signature', name)
+        loaded = []
+
+        def load(name):
+            loaded.append(name)
+            return documents[name]
+
+        assert list(index.revalidate('ec', load)) == [
+            ('a', True), ('c', True), ('d', True)]
+        assert loaded == ['a', 'c', 'd']
+        assert list(index.revalidate('ec', load, revoked={'ec'})) == [
+            ('a', False), ('c', True), ('d', False)]
+
+
+def test_commands(tmp_path, capsys):
+    path = str(tmp_path / 'audit.jsfa')
+    with ArchiveWriter(path) as writer:
+        for document in [signed(1, eckey), signed(2, rsakey),
+                         signed(3, eckey)]:
+            writer.append(document)
+    main(['index', path])
+    main(['revalidate', path, '--key=ec'])
+    lines = capsys.readouterr().out.splitlines()
+    assert [json.loads(line) for line in lines] == [
+        {'document': '0', 'valid': True}, {'document': '2', 'valid': True}]
+    with pytest.raises(SystemExit) as e:
+        main(['revalidate', path, '--key=' + eckey.thumbprint(),
+              '--revoked'])
+    assert e.value.code == 1
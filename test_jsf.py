@@ -1,11 +1,18 @@
 from binascii import unhexlify
 from copy import copy
+from hashlib import new, sha256, sha384
 import json
 from pathlib import Path
+import pickle
+import subprocess
+import sys
 
 import pytest
 
-from jsf import JSF, InvalidJWSSignature, JWK, base64url_encode
+from jsf import (
+    JSF, InvalidJWSOperation, InvalidJWSSignature, JWK, PrevalidationFailed,
+    VerificationFailed, VerificationReport, base64url_encode, sign_digest)
+from org.webpki.json.Canonicalize import canonicalize as _dumpb
 
 
 p256privatekey = JWK(**{
@@ -833,3 +840,230 @@ def test_verify_excluded_modified_fails(key, obj):
 def test_verify_chain():
     jsf = JSF(p256_es256_r2048_rs256_chai_jwk)
     jsf.verify('signature')
+
+
+def test_verify_report():
+    modified = copy(p256_es256_r2048_rs256_mult_jwk)
+    modified['name'] = 'Jane'
+    jsf = JSF(modified)
+    with pytest.raises(VerificationFailed) as e:
+        jsf.verify('signature')
+    report = e.value.report
+    assert report is jsf.report
+    assert (report.passed, report.failed, report.dropped) == (0, 2, 0)
+    assert [r.index for r in report.failures()] == [0, 1]
+    assert all(r.error is not None and r.elapsed >= 0
+               for r in report.failures())
+    assert jsf.verifylog == report.messages
+    assert 'Failed: [' in str(e.value)
+
+
+def test_verify_report_succeeds():
+    jsf = JSF(p256_es256_r2048_rs256_mult_excl_kid)
+    jsf.verify('signature', key=r2048privatekey)
+    assert (jsf.report.passed, jsf.report.failed) == (1, 1)
+    assert jsf.report.entries[1].ok
+    assert jsf.report.entries[1].key_id == 'example.com:r2048'
+
+
+def test_verify_report_capped():
+    report = VerificationReport(max_entries=2)
+    for i in range(5):
+        report.add(i, ValueError(i), None, 0.0)
+    assert len(report) == 5
+    assert len(report.entries) == 2
+    assert report.dropped == 3
+    assert report.messages == ["Failed: [ValueError(0)]",
+                               "Failed: [ValueError(1)]"]
+    assert '... 3 more' in str(report)
+
+
+def test_exceptions_pickle():
+    modified = copy(p256_es256_r2048_rs256_mult_jwk)
+    modified['name'] = 'Jane'
+    with pytest.raises(VerificationFailed) as e:
+        JSF(modified).verify('signature')
+    failed = pickle.loads(pickle.dumps(e.value))
+    assert type(failed) is VerificationFailed
+    assert str(failed) == str(e.value)
+    assert failed.report.failed == 2
+
+    rejected = PrevalidationFailed('payload', 'Payload rejected',
+                                   ValueError('too deep'))
+    copied = pickle.loads(pickle.dumps(rejected))
+    assert type(copied) is PrevalidationFailed
+    assert (copied.reason, copied.args) == (rejected.reason, rejected.args)
+
+
+def test_import_is_lazy():
+    code = ('import sys, jsf; '
+            'print(sorted(m for m in sys.modules '
+            'if m.startswith(("jwcrypto", "cryptography", "org."))))')
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         cwd=str(Path(__file__).parent),
+                         stdout=subprocess.PIPE, universal_newlines=True)
+    assert out.stdout.strip() == '[]'
+
+
+def test_sign_canonical():
+    jsf = JSF({'name': 'Joe', 'id': 2200063})
+    jsf.add_single_signature('signature', p256privatekey, 'ES256')
+    assert jsf.canonical == _dumpb(jsf.payload)
+    signed = copy(jsf.payload['signature'])
+    del signed['value']
+    assert jsf.digest == sha256(_dumpb(dict(jsf.payload,
+                                            signature=signed))).digest()
+    JSF(json.loads(jsf.canonical)).verify('signature', key=p256privatekey)
+
+
+@pytest.mark.parametrize('key,obj', [
+    (None, p256_es256_jwk),
+    (p384privatekey, p384_es384_kid),
+    (None, p256_es256_excl)])
+def test_verify_canonical(key, obj):
+    jsf = JSF(obj)
+    jsf.verify('signature', key=key)
+    assert jsf.canonical == _dumpb(obj)
+    signed = {k: v for k, v in obj.items()
+              if k not in obj['signature'].get('excludes', [])}
+    signed['signature'] = {k: v for k, v in obj['signature'].items()
+                           if k not in ('value', 'excludes')}
+    hashfn = {'ES256': sha256, 'ES384': sha384}[obj['signature']['algorithm']]
+    assert jsf.digest == hashfn(_dumpb(signed)).digest()
+
+
+def test_verify_canonical_fails():
+    modified = copy(p256_es256_jwk)
+    modified['name'] = 'Jane'
+    jsf = JSF(modified)
+    with pytest.raises(InvalidJWSSignature):
+        jsf.verify('signature')
+    with pytest.raises(InvalidJWSOperation):
+        jsf.canonical
+    with pytest.raises(InvalidJWSOperation):
+        jsf.digest
+
+
+@pytest.mark.parametrize('key,alg', [
+    (p256privatekey, 'ES256'), (p384privatekey, 'ES384'),
+    (p521privatekey, 'ES512'), (r2048privatekey, 'RS256'),
+    (r2048privatekey, 'PS384')])
+def test_sign_prehashed(key, alg):
+    jsf = JSF({'name': 'Joe', 'id': 2200063})
+    request = jsf.prepare_single_signature('signature', alg)
+    assert request.digest == new('sha' + alg[-3:],
+                                 request.canonical).digest()
+    jsf.finalize_signature(request, sign_digest(key, alg, request.digest),
+                           key=key)
+    assert jsf.digest == request.digest
+    JSF(json.loads(jsf.canonical)).verify('signature', key=key)
+
+
+def test_sign_prehashed_multiple():
+    jsf = JSF({'name': 'Joe', 'id': 2200063})
+    for key, alg in [(p256privatekey, 'ES256'), (r2048privatekey, 'RS256')]:
+        request = jsf.prepare_signature('signature', alg)
+        jsf.finalize_signature(request, sign_digest(key, alg, request.digest))
+    assert len(jsf.payload['signature']['signers']) == 2
+    JSF(jsf.payload).verify('signature', key=r2048privatekey)
+
+
+def test_sign_prehashed_unsupported():
+    jsf = JSF({'name': 'Joe'})
+    with pytest.raises(InvalidJWSOperation):
+        jsf.prepare_single_signature('signature', 'HS256')
+
+
+def test_sign_prehashed_wrong_key():
+    jsf = JSF({'name': 'Joe'})
+    request = jsf.prepare_single_signature('signature', 'ES256')
+    with pytest.raises(InvalidJWSSignature):
+        jsf.finalize_signature(
+            request, sign_digest(p256privatekey, 'ES256', request.digest),
+            key=JWK.generate(kty='EC', crv='P-256'))
+    assert 'signature' not in jsf._payload
+
+
+def rejection(obj, key=None, allowed_algs=None):
+    jsf = JSF(obj)
+    if allowed_algs is not None:
+        jsf.allowed_algs = allowed_algs
+    # Rejected signatures cost no canonicalization
+    jsf.canonicalizer = None
+    with pytest.raises(VerificationFailed):
+        jsf.verify('signature', key=key)
+    error = jsf.report.entries[0].error
+    assert issubclass(error, PrevalidationFailed)
+    return jsf.report.entries[0].error_args[0]
+
+
+def with_signature(obj, **changes):
+    return dict(obj, signature=dict(obj['signature'], **changes))
+
+
+def test_prevalidate_algorithm():
+    assert 'not allowed' in rejection(p256_es256_jwk, allowed_algs=['RS256'])
+
+
+@pytest.mark.parametrize('value', ['AAAA', 'A' * 4096, None])
+def test_prevalidate_signature(value):
+    obj = with_signature(p256_es256_jwk, value=value)
+    message = rejection(obj)
+    assert 'Signature length' in message or 'Missing' in message
+
+
+@pytest.mark.parametrize('key,obj', [
+    (p256privatekey, r2048_rs256_kid), (p384privatekey, p256_es256_kid),
+    (a256bitkey, p256_es256_kid), (r2048privatekey, a256_hs256_kid)])
+def test_prevalidate_key_type(key, obj):
+    assert 'cannot verify' in rejection(obj, key=key)
+
+
+def test_prevalidate_rsa_key_size():
+    key = JWK.generate(kty='RSA', size=1024)
+    obj = with_signature(r2048_rs256_jwk, publicKey=key.export_public(True))
+    assert 'RSA key size 1024' in rejection(obj)
+
+
+def test_prevalidate_multiple():
+    # Only the signer passing the checks is verified
+    jsf = JSF(p256_es256_r2048_rs256_mult_jwk)
+    jsf.verify('signature', key=r2048privatekey)
+    assert jsf.report.entries[0].error.__name__ == 'PrevalidationFailed'
+    assert jsf.report.entries[1].ok
+
+
+def test_prevalidate_non_object_signers():
+    assert rejection({'signature': {'signers': ['x']}}) == (
+        'Signer is not an object')
+    chain = copy(p256_es256_r2048_rs256_chai_jwk)
+    chain['signature'] = {'chain': chain['signature']['chain'] + ['x']}
+    assert rejection(chain) == 'Signer is not an object'
+
+    multiple = copy(p256_es256_r2048_rs256_mult_jwk)
+    multiple['signature'] = {
+        'signers': ['x'] + multiple['signature']['signers']}
+    jsf = JSF(multiple)
+    jsf.verify('signature')
+    assert not jsf.report.entries[0].ok
+    assert jsf.report.entries[1].ok
+
+    for signature in ['x', {'signers': 'x'}]:
+        with pytest.raises(InvalidJWSSignature):
+            JSF({'signature': signature}).verify('signature')
+
+
+def test_prevalidate_payload():
+    circular = dict(p256_es256_jwk)
+    circular['self'] = circular
+    for payload in [dict(p256_es256_jwk, nan=float('nan')),
+                    dict(p256_es256_jwk, obj=object()), circular]:
+        with pytest.raises(PrevalidationFailed) as e:
+            JSF(payload).verify('signature')
+        assert e.value.reason == 'payload'
+
+
+def test_prevalidate_extensions():
+    with pytest.raises(PrevalidationFailed) as e:
+        JSF(p256_es256_exts).verify('signature')
+    assert e.value.reason == 'extension'
@@ -0,0 +1,89 @@
+import pytest
+
+from jsf import JSF, JWK, InvalidJWSSignature, PrevalidationFailed
+from jsf.merkle import MERKLE_PROOF, MerkleJSF, sign_batch
+
+
+eckey = JWK.generate(kty='EC', crv='P-256')
+hskey = JWK.generate(kty='oct', size=256)
+header = {'publicKey': eckey.export_public(True)}
+
+
+def records(count):
+    return [{'id': i, 'name': 'record {}'.format(i)} for i in range(count)]
+
+
+@pytest.mark.parametrize('count', [1, 2, 3, 5, 8, 13])
+def test_sign_batch(count):
+    jsfs = sign_batch(records(count), 'signature', eckey, 'ES256', header)
+    values = {jsf.payload['signature']['value'] for jsf in jsfs}
+    assert len(values) == 1
+    for i, jsf in enumerate(jsfs):
+        signature = jsf.payload['signature']
+        assert signature['extensions'] == [MERKLE_PROOF]
+        assert signature[MERKLE_PROOF]['index'] == i
+        verifier = MerkleJSF(jsf.payload)
+        verifier.verify('signature')
+        assert verifier.canonical == jsf.canonical
+        assert verifier.digest == jsf.digest
+
+
+def test_verify_with_key():
+    jsfs = sign_batch(records(3), 'signature', hskey, 'HS256')
+    MerkleJSF(jsfs[1].payload).verify('signature', key=hskey)
+    with pytest.raises(InvalidJWSSignature):
+        MerkleJSF(jsfs[1].payload).verify(
+            'signature', key=JWK.generate(kty='oct', size=256))
+
+
+def test_tampered():
+    payloads = [jsf.payload for jsf in sign_batch(
+        records(4), 'signature', eckey, 'ES256', header)]
+    with pytest.raises(InvalidJWSSignature):
+        MerkleJSF(dict(payloads[0], id=9)).verify('signature')
+
+    # A proof for another leaf
+    payloads[0]['signature'][MERKLE_PROOF] = (
+        payloads[1]['signature'][MERKLE_PROOF])
+    with pytest.raises(InvalidJWSSignature):
+        MerkleJSF(payloads[0]).verify('signature')
+
+    payloads[2]['signature'][MERKLE_PROOF]['path'].pop()
+    with pytest.raises(InvalidJWSSignature):
+        MerkleJSF(payloads[2]).verify('signature')
+
+    payloads[3]['signature'][MERKLE_PROOF]['index'] = 4
+    jsf = MerkleJSF(payloads[3])
+    with pytest.raises(InvalidJWSSignature):
+        jsf.verify('signature')
+    assert jsf.report.entries[0].error is PrevalidationFailed
+    assert jsf.report.entries[0].error_args[0] == 'Invalid Merkle proof'
+
+
+def test_unsupported_by_jsf():
+    jsf, = sign_batch(records(1), 'signature', eckey, 'ES256', header)
+    with pytest.raises(PrevalidationFailed) as e:
+        JSF(jsf.payload).verify('signature')
+    assert e.value.reason == 'extension'
+
+
+def test_plain_signatures():
+    jsf = JSF({'id': 1})
+    jsf.add_single_signature('signature', eckey, 'ES256', header)
+    MerkleJSF(jsf.payload).verify('signature')
+
+
+def test_verified_roots(monkeypatch):
+    payloads = [jsf.payload for jsf in sign_batch(
+        records(6), 'signature', eckey, 'ES256', header)]
+    MerkleJSF(payloads[0]).verify('signature')
+
+    from jwcrypto.jwa import JWA
+    engine = type(JWA.signing_alg('ES256'))
+
+    def verify(*args):
+        raise AssertionError('root verified again')
+
+    monkeypatch.setattr(engine, 'verify', verify)
+    for payload in payloads[1:]:
+        MerkleJSF(payload).verify('signature')
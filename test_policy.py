@@ -0,0 +1,99 @@
+from random import Random
+
+import pytest
+
+from jsf import (
+    JSF, JWK, InvalidJWSOperation, InvalidJWSSignature, VerificationPath)
+from jsf.policy import VerificationPolicy
+
+
+eckey = JWK.generate(kty='EC', crv='P-256', kid='ec')
+otherkey = JWK.generate(kty='EC', crv='P-256', kid='other')
+
+
+def signed(i, key=eckey, **payload):
+    jsf = JSF(dict(payload, id=i))
+    jsf.add_single_signature('signature', key, 'ES256',
+                             {'publicKey': key.export_public(True),
+                              'keyId': key['kid']})
+    return jsf.payload
+
+
+def tampered(i, **payload):
+    return dict(signed(i, **payload), id=-i)
+
+
+def test_unverified_payload():
+    with pytest.raises(InvalidJWSOperation):
+        JSF(signed(1)).payload
+    jsf = JSF(signed(1))
+    jsf.verify('signature')
+    assert jsf.verification_path == VerificationPath.VERIFIED
+
+
+def test_verify_all():
+    policy = VerificationPolicy()
+    jsf = JSF(tampered(1))
+    with pytest.raises(InvalidJWSSignature):
+        policy.verify(jsf, 'signature')
+    assert policy.verify(JSF(signed(2)), 'signature') == (
+        VerificationPath.VERIFIED)
+
+
+def test_sample():
+    policy = VerificationPolicy(sample=4, random=Random(0))
+    paths = [policy.verify(JSF(signed(i)), 'signature') for i in range(200)]
+    assert 25 < paths.count(VerificationPath.VERIFIED) < 75
+    assert policy.skipped == paths.count(VerificationPath.SKIPPED)
+
+    jsf = JSF(tampered(1))
+    policy = VerificationPolicy(sample=0)
+    assert policy.verify(jsf, 'signature') == VerificationPath.SKIPPED
+    assert jsf.verification_path == VerificationPath.SKIPPED
+    assert jsf.payload['id'] == -1
+
+
+def test_allow_lists():
+    policy = VerificationPolicy(sample=0, keys={'other'})
+    assert policy.verify(JSF(signed(1)), 'signature') == (
+        VerificationPath.SKIPPED)
+    with pytest.raises(InvalidJWSSignature):
+        policy.verify(JSF(dict(signed(2, otherkey), id=3)), 'signature')
+
+    policy = VerificationPolicy(sample=0, keys={eckey.thumbprint()})
+    assert policy.verify(JSF(signed(1)), 'signature') == (
+        VerificationPath.VERIFIED)
+
+    policy = VerificationPolicy(sample=0, issuers={'payroll'})
+    assert policy.verify(JSF(signed(1, issuer='payroll')), 'signature') == (
+        VerificationPath.VERIFIED)
+    assert policy.verify(JSF(signed(1, issuer='other')), 'signature') == (
+        VerificationPath.SKIPPED)
+
+
+def test_defer():
+    failures = []
+    policy = VerificationPolicy(
+        sample=0, defer=True,
+        on_failure=lambda payload, report: failures.append(
+            (payload['id'], report.failed)))
+    good = JSF(signed(1))
+    bad = JSF(tampered(2))
+    assert policy.verify(good, 'signature') == VerificationPath.DEFERRED
+    assert policy.verify(bad, 'signature') == VerificationPath.DEFERRED
+    # Changes after handing the document over are not seen
+    bad.payload['id'] = 2
+    policy.join()
+    assert failures == [(-2, 1)]
+    assert (policy.deferred, policy.failed) == (2, 1)
+    policy.close()
+
+
+def test_defer_full_queue():
+    policy = VerificationPolicy(sample=0, defer=True, queue_size=1)
+    # The background thread is not consuming yet
+    policy._start = lambda: None
+    assert policy.verify(JSF(signed(1)), 'signature') == (
+        VerificationPath.DEFERRED)
+    assert policy.verify(JSF(signed(2)), 'signature') == (
+        VerificationPath.VERIFIED)
@@ -0,0 +1,82 @@
+from time import monotonic
+
+from jsf import JSF, JWK
+from jsf.batch import ErrorCode, verify_batch
+from jsf.schedule import CostModel, plan, run_planned
+
+
+eckey = JWK.generate(kty='EC', crv='P-256')
+p521key = JWK.generate(kty='EC', crv='P-521')
+rsakey = JWK.generate(kty='RSA', size=2048)
+rsa4096key = JWK.generate(kty='RSA', size=4096)
+
+
+def signed(key, alg, payload=None, add='add_single_signature', count=1):
+    jsf = JSF(payload or {'id': 1})
+    for _ in range(count):
+        getattr(jsf, add)('signature', key, alg,
+                          {'publicKey': key.export_public(True)})
+    return jsf.payload
+
+
+def test_estimate():
+    model = CostModel()
+    es256 = model.estimate(signed(eckey, 'ES256'), 'signature')
+    assert model.estimate(signed(p521key, 'ES512'), 'signature') > es256
+    assert (model.estimate(signed(rsa4096key, 'RS256'), 'signature') >
+            model.estimate(signed(rsakey, 'RS256'), 'signature'))
+    assert (model.estimate(signed(eckey, 'ES256', add='add_chain_signature',
+                                  count=3), 'signature') > 3 * es256 * 0.9)
+    big = signed(eckey, 'ES256', {'data': ['x' * 100] * 1000})
+    assert model.estimate(big, 'signature') > es256 + 1000 * 100 * 1e-7
+    assert model.estimate({'id': 1}, 'signature') > 0
+
+
+def test_estimate_malformed():
+    model = CostModel()
+    assert model.estimate({}, ['x']) == model.unknown_cost
+    document = signed(eckey, 'ES256')
+    document['signature']['algorithm'] = 5
+    assert model.estimate(document, 'signature') > model.unknown_cost
+    document['signature']['algorithm'] = 'EdDSA'
+    document['signature']['publicKey']['crv'] = ['x']
+    assert model.estimate(document, 'signature') > model.algorithm_costs[
+        'EdDSA']
+
+
+def test_observe():
+    model = CostModel(smoothing=0.5)
+    estimate = model.estimate(signed(eckey, 'ES256'), 'signature')
+    for _ in range(20):
+        model.observe(estimate, 3 * estimate)
+    assert 2.9 < model.scale < 3.1
+
+
+def test_plan():
+    # The expensive item would make two cheap ones late
+    order, dropped = plan([4.0, 1.0, 1.0, 1.0], [4.0, 5.0, 5.0, 5.0],
+                          now=0.0)
+    assert (order, dropped) == ([1, 2, 3], [0])
+    order, dropped = plan([1.0, 3.0, 1.0, 2.0], [None, 10.0, None, 4.0],
+                          now=0.0)
+    assert (order, dropped) == ([3, 1, 0, 2], [])
+
+
+def test_run_planned():
+    ran = []
+    skipped = run_planned([0, 1], [0.0, 0.0], [monotonic() - 1, None],
+                          ran.append)
+    assert (ran, skipped) == ([1], [0])
+
+
+def test_verify_batch_deadlines():
+    column = [signed(eckey, 'ES256'), signed(rsakey, 'RS256'), {'id': 2}]
+    mask, errors = verify_batch(column, 'signature', numpy=False,
+                                deadlines=monotonic() + 10)
+    assert list(mask) == [1, 1, 0]
+    assert errors[2] == ErrorCode.MALFORMED
+
+    mask, errors = verify_batch(column, 'signature', numpy=False,
+                                deadlines=[monotonic() - 1, None, None])
+    assert list(mask) == [0, 1, 0]
+    assert errors[0] == ErrorCode.DEADLINE
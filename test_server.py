@@ -0,0 +1,184 @@
+import asyncio
+import json
+from threading import Event
+
+import pytest
+
+from jsf import JSF, JWK
+from jsf.server import KeyCache, VerificationService, start_server
+
+
+eckey = JWK.generate(kty='EC', crv='P-256', kid='ec')
+rsakey = JWK.generate(kty='RSA', size=2048, kid='rsa')
+
+
+async def request(port, method, path, body=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    data = b'' if body is None else json.dumps(body).encode('utf-8')
+    writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\n'
+                 'Connection: close\r\n\r\n'.format(method, path, len(data))
+                 .encode('latin-1') + data)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+
+def run(service, client):
+    async def main():
+        server = await start_server(service, host='127.0.0.1', port=0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            return await client(port)
+        finally:
+            server.close()
+            await server.wait_closed()
+            await service.close()
+
+    return asyncio.run(main())
+
+
+def signed(i, key=eckey, alg='ES256'):
+    jsf = JSF({'id': i})
+    jsf.add_single_signature('signature', key, alg,
+                             {'publicKey': key.export_public(True)})
+    return jsf.payload
+
+
+def test_verify():
+    service = VerificationService(KeyCache([rsakey]))
+
+    async def client(port):
+        status, ok = await request(port, 'POST', '/verify',
+                                   {'document': signed(1)})
+        assert (status, ok['valid'], ok['error']) == (200, True, None)
+        status, ok = await request(port, 'POST', '/verify',
+                                   {'document': signed(2, rsakey, 'RS256'),
+                                    'keyId': 'rsa'})
+        assert ok['valid'] and ok['results'][0]['keyId'] == 'rsa'
+        tampered = dict(signed(3), id=4)
+        status, failed = await request(port, 'POST', '/verify',
+                                       {'document': tampered})
+        assert (status, failed['valid']) == (200, False)
+        assert not failed['results'][0]['ok']
+
+    run(service, client)
+    # The embedded public key was parsed once
+    assert len(service.keys._public) == 1
+
+
+def test_sign():
+    service = VerificationService(KeyCache([eckey]))
+
+    async def client(port):
+        status, response = await request(
+            port, 'POST', '/sign',
+            {'document': {'name': 'Joe'}, 'keyId': 'ec',
+             'algorithm': 'ES256'})
+        assert status == 200
+        JSF(response['document']).verify('signature', key=eckey)
+        status, response = await request(
+            port, 'POST', '/sign',
+            {'document': {'name': 'Joe'}, 'keyId': 'missing'})
+        assert status == 400
+
+    run(service, client)
+
+
+def test_errors():
+    async def client(port):
+        assert (await request(port, 'GET', '/verify'))[0] == 405
+        assert (await request(port, 'POST', '/nowhere', {}))[0] == 404
+        assert (await request(port, 'GET', '/elsewhere'))[0] == 404
+        assert (await request(port, 'POST', '/verify', [1]))[0] == 400
+        for body in ({'document': {}, 'property': ['x']},
+                     {'document': signed(1), 'algorithm': 5}):
+            status, response = await request(port, 'POST', '/verify', body)
+            assert status == 400 and 'error' in response
+        document = signed(2)
+        document['signature']['algorithm'] = 5
+        status, response = await request(port, 'POST', '/verify',
+                                         {'document': document})
+        assert (status, response['valid']) == (200, False)
+        return await request(port, 'GET', '/metrics')
+
+    _, metrics = run(VerificationService(), client)
+    assert metrics['requests'] == {'/verify': 5, 'other': 2}
+    assert set(metrics['latency']) == {'/verify', 'other'}
+
+
+def test_keys_need_ids():
+    with pytest.raises(ValueError):
+        KeyCache([JWK.generate(kty='EC', crv='P-256')])
+
+
+def test_coalescing_and_metrics():
+    service = VerificationService(max_batch=8, max_delay=0.01)
+
+    async def client(port):
+        docs = [signed(i) for i in range(16)]
+        responses = await asyncio.gather(*(
+            request(port, 'POST', '/verify', {'document': d}) for d in docs))
+        assert all(r['valid'] for _, r in responses)
+        return await request(port, 'GET', '/metrics')
+
+    status, metrics = run(service, client)
+    assert status == 200
+    assert metrics['requests']['/verify'] == 16
+    assert metrics['batches'] < 16
+    assert metrics['meanBatchSize'] > 1
+    assert set(metrics['latency']['/verify']) == {'p50', 'p99', 'max'}
+
+
+def test_backpressure():
+    service = VerificationService(workers=1, max_batch=1, max_delay=0,
+                                  queue_size=2)
+    release = Event()
+    # Hold the only worker until the queue has filled up
+    service._handlers['/block'] = lambda request: (release.wait(5),
+                                                   (200, {}))[1]
+
+    async def client(port):
+        blocked = asyncio.ensure_future(
+            request(port, 'POST', '/block', {'document': {}}))
+        await asyncio.sleep(0.1)
+        pending = [asyncio.ensure_future(
+            request(port, 'POST', '/verify', {'document': signed(i)}))
+            for i in range(6)]
+        await asyncio.sleep(0.1)
+        release.set()
+        statuses = [s for s, _ in await asyncio.gather(*pending)]
+        await blocked
+        return statuses
+
+    statuses = run(service, client)
+    assert statuses.count(503) >= 1
+    assert statuses.count(200) >= 2
+    assert service.metrics.rejected == statuses.count(503)
+
+
+def test_timeout():
+    service = VerificationService(workers=1, max_batch=1, max_delay=0)
+    release = Event()
+    service._handlers['/block'] = lambda request: (release.wait(5),
+                                                   (200, {}))[1]
+
+    async def client(port):
+        blocked = asyncio.ensure_future(
+            request(port, 'POST', '/block', {'document': {}}))
+        await asyncio.sleep(0.1)
+        late = asyncio.ensure_future(request(
+            port, 'POST', '/verify', {'document': signed(0),
+                                      'timeout': 0.05}))
+        patient = asyncio.ensure_future(request(
+            port, 'POST', '/verify', {'document': signed(1), 'timeout': 10}))
+        await asyncio.sleep(0.2)
+        release.set()
+        await blocked
+        return await late, await patient
+
+    (late_status, late), (status, patient) = run(service, client)
+    assert (late_status, late['skipped']) == (504, True)
+    assert (status, patient['valid']) == (200, True)
+    assert service.metrics.skipped == 1
@@ -0,0 +1,134 @@
+import asyncio
+import json
+
+import pytest
+
+from jsf import JSF, JWK
+from jsf.signers import (
+    BatchingSigner, LocalSigner, SocketSigner, add_chain_signature,
+    add_signature, add_single_signature, start_signer_server)
+
+
+eckey = JWK.generate(kty='EC', crv='P-256', kid='ec')
+rsakey = JWK.generate(kty='RSA', size=2048, kid='rsa')
+
+
+def test_local_signer():
+    jsf = JSF({'name': 'Joe'})
+    asyncio.run(add_single_signature(jsf, 'signature', LocalSigner(eckey),
+                                     'ES256'))
+    JSF(jsf.payload).verify('signature', key=eckey)
+
+
+def test_local_signer_multiple_and_chain():
+    async def sign(jsf, add):
+        await add(jsf, 'signature', LocalSigner(eckey), 'ES256')
+        await add(jsf, 'signature', LocalSigner(rsakey), 'PS256')
+
+    multiple = JSF({'name': 'Joe'})
+    asyncio.run(sign(multiple, add_signature))
+    JSF(multiple.payload).verify('signature', key=rsakey)
+
+    chain = JSF({'name': 'Joe'})
+    asyncio.run(sign(chain, add_chain_signature))
+    assert len(chain.payload['signature']['chain']) == 2
+
+
+def test_batching_signer_coalesces():
+    backend = LocalSigner(eckey, latency=0.01)
+
+    async def sign_all(docs):
+        signer = BatchingSigner(backend, max_batch=8, max_delay=0.005)
+        await asyncio.gather(*(add_single_signature(d, 'signature', signer,
+                                                    'ES256')
+                               for d in docs))
+        await signer.close()
+
+    docs = [JSF({'id': i}) for i in range(20)]
+    asyncio.run(sign_all(docs))
+    assert backend.calls == 3
+    for d in docs:
+        JSF(d.payload).verify('signature', key=eckey)
+
+
+def test_batching_signer_propagates_errors():
+    backend = LocalSigner(eckey)
+
+    async def sign():
+        signer = BatchingSigner(backend)
+        try:
+            return await asyncio.gather(signer.sign('ES256', b'\0' * 32),
+                                        signer.sign('HS256', b'\0' * 32),
+                                        return_exceptions=True)
+        finally:
+            await signer.close()
+
+    signature, error = asyncio.run(sign())
+    assert backend.calls == 1
+    assert isinstance(signature, bytes) and len(signature) == 64
+    assert isinstance(error, Exception)
+
+
+class ShortSigner(LocalSigner):
+    async def sign_batch(self, items):
+        return (await super().sign_batch(items))[:-1]
+
+
+class HangingSigner(LocalSigner):
+    async def sign_batch(self, items):
+        await asyncio.sleep(3600)
+
+
+def test_batching_signer_resolves_all():
+    async def short():
+        signer = BatchingSigner(ShortSigner(eckey))
+        return await asyncio.gather(signer.sign('ES256', b'\0' * 32),
+                                    signer.sign('ES256', b'\1' * 32),
+                                    return_exceptions=True)
+
+    results = asyncio.run(short())
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def cancelled():
+        signer = BatchingSigner(HangingSigner(eckey), max_delay=0)
+        sign = asyncio.ensure_future(signer.sign('ES256', b'\0' * 32))
+        await asyncio.sleep(0.01)
+        for task in signer._tasks:
+            task.cancel()
+        return await asyncio.wait_for(sign, 1)
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancelled())
+
+
+def test_socket_signer(tmp_path):
+    path = str(tmp_path / 'signer.sock')
+
+    async def sign_all(docs):
+        server = await start_signer_server({'ec': eckey, 'rsa': rsakey},
+                                           path=path)
+        signer = BatchingSigner(SocketSigner('rsa', path=path, pool_size=2))
+        try:
+            await asyncio.gather(*(add_single_signature(d, 'signature',
+                                                        signer, 'RS256')
+                                   for d in docs))
+            with pytest.raises(RuntimeError):
+                await SocketSigner('missing', path=path).sign(
+                    'RS256', b'\0' * 32)
+            ok, error = await SocketSigner('ec', path=path).sign_batch(
+                [('ES256', b'\0' * 32), ('ES256', b'\0')])
+            assert isinstance(ok, bytes)
+            assert isinstance(error, RuntimeError)
+            # Well beyond the 64 KiB default of asyncio streams
+            signatures = await SocketSigner('ec', path=path).sign_batch(
+                [('ES256', bytes(32))] * 2000)
+            assert all(isinstance(s, bytes) for s in signatures)
+        finally:
+            await signer.close()
+            server.close()
+            await server.wait_closed()
+
+    docs = [JSF({'id': i}) for i in range(10)]
+    asyncio.run(sign_all(docs))
+    for d in docs:
+        JSF(json.loads(d.canonical)).verify('signature', key=rsakey)
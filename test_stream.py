@@ -0,0 +1,67 @@
+import io
+import json
+
+import pytest
+
+from jsf import JSF, JWK, InvalidJWSOperation
+from jsf.stream import StreamSigner
+
+
+eckey = JWK.generate(kty='EC', crv='P-256')
+rsakey = JWK.generate(kty='RSA', size=2048)
+hskey = JWK.generate(kty='oct', size=256)
+edkey = JWK.generate(kty='OKP', crv='Ed25519')
+
+
+def rows(count):
+    for i in range(count):
+        yield {'id': i, 'tags': [str(j) for j in range(i % 3)]}
+
+
+@pytest.mark.parametrize('key,alg', [
+    (eckey, 'ES256'), (rsakey, 'PS384'), (hskey, 'HS256')])
+@pytest.mark.parametrize('prop', ['aSignature', 'signature', 'zSignature'])
+def test_stream(key, alg, prop):
+    out = io.BytesIO()
+    header = ({} if key is hskey
+              else {'publicKey': key.export_public(True)})
+    with StreamSigner(out, prop, key, alg, header) as signer:
+        signer.member('name', 'export')
+        signer.member('rows', ({'id': i} for i in range(3)))
+        signer.member('table', (iter([i, i * 2]) for i in range(2)))
+        signer.member('total', 3)
+    document = json.loads(out.getvalue())
+    assert document == {
+        'name': 'export', 'rows': [{'id': 0}, {'id': 1}, {'id': 2}],
+        'table': [[0, 0], [1, 2]], 'total': 3, prop: signer.signature}
+    assert list(document)[-1] == prop
+    JSF(document).verify(prop, key=key if key is hskey else None)
+
+
+def test_canonical_output():
+    out = io.BytesIO()
+    with StreamSigner(out, 'signature', eckey, 'ES256') as signer:
+        signer.member('id', 1)
+        signer.member('rows', rows(4))
+    jsf = JSF(json.loads(out.getvalue()))
+    jsf.verify('signature', key=eckey)
+    # The signature property sorts last here
+    assert jsf.canonical == out.getvalue()
+
+
+def test_member_order():
+    signer = StreamSigner(io.BytesIO(), 'signature', eckey, 'ES256')
+    signer.member('b', 1)
+    for name in ['a', 'b', 'signature']:
+        with pytest.raises(ValueError):
+            signer.member(name, 1)
+    signer.close()
+    with pytest.raises(ValueError):
+        signer.member('c', 1)
+
+
+def test_unsupported():
+    with pytest.raises(InvalidJWSOperation):
+        StreamSigner(io.BytesIO(), 'signature', edkey, 'EdDSA')
+    with pytest.raises(ValueError):
+        StreamSigner(io.BytesIO(), 'signature', eckey)